@@ -0,0 +1,147 @@
+"""Аутентификация по токену с кешированием пользователя
+
+TokenAuthentication загружает токен вместе с пользователем при каждом
+запросе. CachedTokenAuthentication хранит значения полей токена и
+пользователя в ограниченном по размеру кеше процесса на AUTH_CACHE
+['TIMEOUT'] секунд, а при заданном AUTH_CACHE['SHARED_TIMEOUT'] - еще и
+в общем кеше Django. Каждый запрос получает собственные экземпляры
+моделей. Хеш пароля и счетчики (counter_fields модели) не кешируются и
+загружаются при обращении к ним, поэтому устаревшие значения счетчиков
+не попадают ни в ответы, ни в сохранение пользователя.
+
+Записи удаляются при удалении токена (выход через djoser) и при
+сохранении пользователя (смена пароля, блокировка). Кеши других
+процессов очищаются по истечении своего срока.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+User = get_user_model()
+
+SHARED_KEY = 'auth-token:{digest}'
+# Поля пользователя, которые не кешируются
+UNCACHED_FIELDS = frozenset({'password'})
+
+
+class LocalCache:
+    """Кеш процесса с вытеснением давно не использованных записей"""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = LocalCache(
+                    settings.AUTH_CACHE['SIZE'], settings.AUTH_CACHE['TIMEOUT']
+                )
+    return _local_cache
+
+
+def _shared_key(key):
+    # The token itself is a secret and is not used as a cache key
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return SHARED_KEY.format(digest=digest)
+
+
+def _cached_fields(model):
+    uncached = UNCACHED_FIELDS.union(getattr(model, 'counter_fields', ()))
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname not in uncached
+    ]
+
+
+def _dump(instance):
+    return tuple(getattr(instance, name) for name in _cached_fields(
+        type(instance)
+    ))
+
+
+def _load(model, values):
+    return model.from_db(DEFAULT_DB_ALIAS, _cached_fields(model), values)
+
+
+def invalidate_tokens(keys):
+    """Удаление записей токенов из кешей"""
+    shared_keys = []
+    for key in keys:
+        get_local_cache().delete(key)
+        shared_keys.append(_shared_key(key))
+    if shared_keys and settings.AUTH_CACHE['SHARED_TIMEOUT']:
+        cache.delete_many(shared_keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кешированием токена и пользователя"""
+
+    def get_cached(self, key):
+        local_cache = get_local_cache()
+        entry = local_cache.get(key)
+        if entry is not None:
+            return entry
+        timeout = settings.AUTH_CACHE['SHARED_TIMEOUT']
+        if timeout:
+            entry = cache.get(_shared_key(key))
+            if entry is not None:
+                local_cache.set(key, entry)
+        return entry
+
+    def set_cached(self, key, entry):
+        get_local_cache().set(key, entry)
+        timeout = settings.AUTH_CACHE['SHARED_TIMEOUT']
+        if timeout:
+            cache.set(_shared_key(key), entry, timeout)
+
+    def authenticate_credentials(self, key):
+        entry = self.get_cached(key)
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            entry = (_dump(token), _dump(user))
+            self.set_cached(key, entry)
+            return user, token
+        token_values, user_values = entry
+        token = _load(self.get_model(), token_values)
+        token.user = _load(User, user_values)
+        return token.user, token
@@ -0,0 +1,73 @@
+"""HTTP-кеширование справочников
+
+Ответы справочников тегов и ингредиентов зависят только от адреса запроса
+и версии справочников, поэтому ETag вычисляется до аутентификации и
+обращения к базе данных. Запрос с совпадающим If-None-Match получает
+ответ 304, а готовое тело ответа берется из кеша по ключу с версией.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from recipes.catalog import get_catalog_version
+
+PAYLOAD_KEY = 'catalog-payload:{etag}'
+CACHED_FORMAT = 'json'
+
+
+class CatalogCacheMixin:
+    """
+    Условные GET-запросы и кеширование ответов для представлений
+    справочников. Кешируются только ответы в формате JSON: HTML-страница
+    браузерного API зависит от пользователя.
+    """
+    cache_methods = ('GET', 'HEAD')
+
+    def get_catalog_etag(self, request):
+        digest = hashlib.md5('\n'.join((
+            get_catalog_version(),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', '')
+        )).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in self.cache_methods:
+            return super().dispatch(request, *args, **kwargs)
+        etag = self.get_catalog_etag(request)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return self.finalize_cached(HttpResponseNotModified(), etag)
+        key = PAYLOAD_KEY.format(etag=etag)
+        payload = cache.get(key)
+        if payload is not None:
+            content, content_type = payload
+            return self.finalize_cached(
+                HttpResponse(content, content_type=content_type), etag
+            )
+        response = super().dispatch(request, *args, **kwargs)
+        renderer = getattr(response, 'accepted_renderer', None)
+        if (
+            response.status_code != 200
+            or renderer is None or renderer.format != CACHED_FORMAT
+        ):
+            return response
+        response.render()
+        cache.set(
+            key, (response.content, response['Content-Type']),
+            settings.RECIPES['CATALOG_CACHE_TIMEOUT']
+        )
+        return self.finalize_cached(response, etag)
+
+    @staticmethod
+    def finalize_cached(response, etag):
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True,
+            max_age=settings.RECIPES['CATALOG_MAX_AGE']
+        )
+        patch_vary_headers(response, ('Accept',))
+        return response
@@ -0,0 +1,43 @@
+"""Проверки настроек кеширования API
+
+Кеш контекста пользователя, представлений рецептов и аутентификации
+сбрасывается сменой версий в кеше Django. Локальный кеш процесса видит
+только свои изменения, поэтому при нескольких процессах сервера ответы
+остаются устаревшими до истечения срока хранения.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+PROCESS_LOCAL_CACHES = frozenset({
+    'django.core.cache.backends.locmem.LocMemCache',
+})
+
+
+def _shared_cache_settings():
+    return (
+        ('RECIPES', 'USER_CONTEXT_TIMEOUT',
+         settings.RECIPES['USER_CONTEXT_TIMEOUT']),
+        ('RECIPES', 'RECIPE_FRAGMENT_TIMEOUT',
+         settings.RECIPES['RECIPE_FRAGMENT_TIMEOUT']),
+        ('AUTH_CACHE', 'SHARED_TIMEOUT',
+         settings.AUTH_CACHE['SHARED_TIMEOUT']),
+    )
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f"{group}['{name}'] is enabled with a process-local cache.",
+            hint=(
+                'Changes made by one server process stay invisible to the '
+                'others until the timeout expires. Configure a shared '
+                'CACHES backend (CACHE_BACKEND, CACHE_LOCATION) or run a '
+                'single process.'
+            ),
+            id='api.W001',
+        )
+        for group, name, timeout in _shared_cache_settings() if timeout
+    ]
@@ -0,0 +1,110 @@
+"""Пользовательский контекст запроса
+
+Идентификаторы избранных рецептов, рецептов в списке покупок и авторов,
+на которых подписан пользователь, загружаются один раз за запрос, а при
+заданном RECIPES['USER_CONTEXT_TIMEOUT'] берутся из кеша. Ключ кеша
+содержит версию, которая заменяется при каждом изменении списков
+пользователя, поэтому устаревшие записи просто перестают читаться.
+Версия заменяется после фиксации транзакции обработчиками сигналов
+избранного, списка покупок и подписок (в том числе при каскадном удалении
+и изменениях в админке) и представлениями пакетных операций.
+
+Кеш контекста имеет смысл только при общем для всех процессов кеше Django:
+с локальным кешем процесса изменения, сделанные в одном процессе, не видны
+остальным до истечения USER_CONTEXT_TIMEOUT (см. api.checks).
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+REQUEST_ATTRIBUTE = '_user_context'
+VERSION_KEY = 'user-context-version:{user_id}'
+DATA_KEY = 'user-context:{user_id}:{version}'
+
+
+class UserContext:
+    """Множества идентификаторов, связанных с пользователем"""
+
+    def __init__(self, favorite_ids=(), cart_ids=(), subscription_ids=()):
+        self.favorite_ids = frozenset(favorite_ids)
+        self.cart_ids = frozenset(cart_ids)
+        self.subscription_ids = frozenset(subscription_ids)
+
+    @classmethod
+    def load(cls, user):
+        """Загрузка множеств из базы данных"""
+        return cls(
+            Favorite.objects.filter(user=user)
+            .values_list('recipe_id', flat=True),
+            ShoppingCart.objects.filter(user=user)
+            .values_list('recipe_id', flat=True),
+            Subscription.objects.filter(subscriber=user)
+            .values_list('author_id', flat=True)
+        )
+
+    @classmethod
+    def for_user(cls, user):
+        """Контекст пользователя с использованием кеша"""
+        if not user.is_authenticated:
+            return cls()
+        timeout = settings.RECIPES['USER_CONTEXT_TIMEOUT']
+        if not timeout:
+            return cls.load(user)
+        version_key = VERSION_KEY.format(user_id=user.pk)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, uuid4().hex, None)
+            version = cache.get(version_key)
+        data_key = DATA_KEY.format(user_id=user.pk, version=version)
+        context = cache.get(data_key)
+        if context is None:
+            context = cls.load(user)
+            cache.set(data_key, context, timeout)
+        return context
+
+    @staticmethod
+    def invalidate(user):
+        """Смена версии кешированного контекста пользователя"""
+        invalidate_user_contexts([user.pk])
+
+
+def invalidate_user_contexts(user_ids):
+    """
+    Смена версий кешированных контекстов пользователей после фиксации
+    текущей транзакции, чтобы параллельный запрос не сохранил в кеш
+    под новой версией еще не зафиксированные данные
+    """
+    user_ids = set(user_ids)
+    if not user_ids or not settings.RECIPES['USER_CONTEXT_TIMEOUT']:
+        return
+    transaction.on_commit(lambda: cache.set_many(
+        {
+            VERSION_KEY.format(user_id=user_id): uuid4().hex
+            for user_id in user_ids
+        },
+        None
+    ))
+
+
+def get_user_context(request):
+    """Контекст пользователя, загружаемый не чаще одного раза за запрос"""
+    if request is None:
+        return UserContext()
+    context = getattr(request, REQUEST_ATTRIBUTE, None)
+    if context is None:
+        context = UserContext.for_user(request.user)
+        setattr(request, REQUEST_ATTRIBUTE, context)
+    return context
+
+
+def refresh_user_context(request):
+    """Сброс контекста после изменения списков пользователя"""
+    if request.user.is_authenticated:
+        UserContext.invalidate(request.user)
+    if hasattr(request, REQUEST_ATTRIBUTE):
+        delattr(request, REQUEST_ATTRIBUTE)
@@ -2,8 +2,11 @@
 import base64
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from recipes.images import variant_names
+
 
 class DecodingImageField(serializers.ImageField):
     """Поле изображение с декодированием из Base64"""
@@ -38,3 +41,33 @@ class ImageRelatedField(serializers.SlugRelatedField):
     def to_representation(self, value):
         image = super().to_representation(value)
         return image.url
+
+
+def get_variant_urls(recipe, request=None):
+    """
+    Ссылки на уменьшенные копии изображения рецепта. Пока копии не
+    готовы, все ссылки указывают на исходное изображение.
+    """
+    if not recipe.image:
+        return None
+    names = variant_names(recipe.image.name)
+    if not recipe.images_ready:
+        names = dict.fromkeys(names, recipe.image.name)
+    urls = {key: default_storage.url(name) for key, name in names.items()}
+    if request is not None:
+        urls = {
+            key: request.build_absolute_uri(url)
+            for key, url in urls.items()
+        }
+    return urls
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения рецепта"""
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return get_variant_urls(recipe, self.context.get('request'))
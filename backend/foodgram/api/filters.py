@@ -1,40 +1,40 @@
-from django.db.models import OuterRef
 from django_filters import rest_framework as filter
 
 from recipes.models import Favorite, ShoppingCart, Tag
-
-
-class IngredientFilter(filter.FilterSet):
-    name = filter.CharFilter(lookup_expr='istartswith')
+from recipes.services import tags_mask
 
 
 class RecipeFilter(filter.FilterSet):
     author = filter.NumberFilter(lookup_expr='exact', field_name='author__id')
-    is_in_shopping_cart = filter.BooleanFilter()
-    is_favorited = filter.BooleanFilter()
+    is_in_shopping_cart = filter.BooleanFilter(method='filter_user_list')
+    is_favorited = filter.BooleanFilter(method='filter_user_list')
     tags = filter.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         to_field_name='slug',
-        lookup_expr='exact',
-        field_name='tags__slug'
+        method='filter_tags'
     )
 
-
-class RecipeListFilter(filter.FilterSet):
-
-    @property
-    def qs(self):
-        parent = super().qs
-        return parent.filter(recipe=OuterRef('pk'), user=self.request.user)
-
-
-class ShoppingCartFilter(RecipeListFilter):
-    class Meta:
-        model = ShoppingCart
-        fields = []
-
-
-class FavoritesFilter(RecipeListFilter):
-    class Meta:
-        model = Favorite
-        fields = []
+    USER_LISTS = {
+        'is_in_shopping_cart': ShoppingCart,
+        'is_favorited': Favorite
+    }
+
+    def filter_user_list(self, queryset, name, value):
+        """Отбор рецептов по наличию в списке пользователя"""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        recipe_ids = (
+            self.USER_LISTS[name].objects.filter(user=user).values('recipe')
+        )
+        if value:
+            return queryset.filter(pk__in=recipe_ids)
+        return queryset.exclude(pk__in=recipe_ids)
+
+    def filter_tags(self, queryset, name, tags):
+        """Отбор рецептов, имеющих хотя бы один из тегов, по маске тегов"""
+        if not tags:
+            return queryset
+        return queryset.filter(
+            tags_mask__hasanybits=tags_mask(tag.bit for tag in tags)
+        )
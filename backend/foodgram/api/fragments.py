@@ -0,0 +1,75 @@
+"""Кеш представлений рецептов
+
+Представление рецепта одинаково для всех пользователей, кроме признаков
+is_favorited, is_in_shopping_cart и author.is_subscribed, поэтому оно
+хранится в кеше целиком и дополняется признаками текущего пользователя
+при каждом ответе. Вместе с представлением хранится штамп из времени
+изменения рецепта, автора, готовности копий изображений, версии
+справочников и адреса сайта: фрагмент с другим штампом считается
+устаревшим. Изменение профиля автора удаляет фрагменты его рецептов.
+Кеш включается настройкой RECIPES['RECIPE_FRAGMENT_TIMEOUT'].
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.catalog import get_catalog_version
+from recipes.models import Recipe
+
+FRAGMENT_KEY = 'recipe-fragment:{recipe_id}'
+
+
+def fragment_key(recipe_id):
+    return FRAGMENT_KEY.format(recipe_id=recipe_id)
+
+
+def get_stamp(recipe, catalog_version, base_url):
+    """Штамп актуальности представления рецепта"""
+    return (
+        recipe.created.isoformat(), recipe.author_id, recipe.images_ready,
+        catalog_version, base_url
+    )
+
+
+def load_fragments(recipes, build, request=None):
+    """
+    Представления рецептов из кеша, полученные одним запросом к кешу.
+    Недостающие представления создаются функцией build, получающей
+    список рецептов, и сохраняются в кеше.
+    """
+    timeout = settings.RECIPES['RECIPE_FRAGMENT_TIMEOUT']
+    if not timeout:
+        return build(recipes)
+    catalog_version = get_catalog_version()
+    base_url = request.build_absolute_uri('/') if request else ''
+    stamps = {
+        recipe.pk: get_stamp(recipe, catalog_version, base_url)
+        for recipe in recipes
+    }
+    cached = cache.get_many([fragment_key(pk) for pk in stamps])
+    fragments = {}
+    for pk, stamp in stamps.items():
+        entry = cached.get(fragment_key(pk))
+        if entry is not None and entry[0] == stamp:
+            fragments[pk] = entry[1]
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    if missing:
+        built = dict(zip(
+            (recipe.pk for recipe in missing), build(missing)
+        ))
+        cache.set_many({
+            fragment_key(pk): (stamps[pk], fragment)
+            for pk, fragment in built.items()
+        }, timeout)
+        fragments.update(built)
+    return [fragments[recipe.pk] for recipe in recipes]
+
+
+def invalidate_author_fragments(author):
+    """Удаление представлений рецептов автора"""
+    if not settings.RECIPES['RECIPE_FRAGMENT_TIMEOUT']:
+        return
+    cache.delete_many([
+        fragment_key(pk)
+        for pk in Recipe.objects.filter(author=author)
+        .values_list('pk', flat=True)
+    ])
@@ -0,0 +1,207 @@
+"""Модуль измерения производительности API
+
+Команда создает тестовую базу данных, заполняет ее синтетическими данными
+заданного объема и многократно выполняет запросы к основным адресам API
+через тестовый клиент Django. Для каждого сценария вычисляются медиана
+и 95-й процентиль времени ответа и количество SQL-запросов. Результат
+выводится в формате JSON; файл результата предыдущего запуска можно
+передать в --compare, чтобы получить отношения времен и разницу
+количества запросов. Ограничение частоты запросов на время измерений
+отключается.
+"""
+import json
+import math
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import (setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from rest_framework.authtoken.models import Token
+
+from foodgram.metrics import QueryTimer
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                            User)
+from recipes.synthetic import DEFAULT_SKEW, DataGenerator
+from users.models import Subscription
+
+API_URL = '/api/v1/'
+
+
+def percentile(values, fraction):
+    """Значение процентиля по методу ближайшего ранга"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a test database and reports API endpoint latency '
+        'percentiles and query counts as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--cart', type=int, default=50000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skew', type=float, default=DEFAULT_SKEW)
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Measured requests per scenario'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Unmeasured requests per scenario'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep the test database and reuse its data on the next run'
+        )
+        parser.add_argument('--output', help='Write the JSON report to file')
+        parser.add_argument(
+            '--compare', help='JSON report of a previous run to compare with'
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        databases = setup_databases(
+            options['verbosity'], interactive=False, keepdb=options['keepdb']
+        )
+        try:
+            # Throttling would turn repeated requests into 429 responses and
+            # spend the limits of the server's persistent bucket store
+            with override_settings(
+                THROTTLE={**settings.THROTTLE, 'ENABLED': False}
+            ):
+                report = self.run(options)
+        finally:
+            teardown_databases(
+                databases, options['verbosity'], keepdb=options['keepdb']
+            )
+            teardown_test_environment()
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                report['comparison'] = self.compare(
+                    json.load(file)['results'], report['results']
+                )
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+    def seed(self, options):
+        if Recipe.objects.exists():
+            return
+        self.stderr.write('Заполнение базы данных...')
+        started = time.perf_counter()
+        DataGenerator(options['seed'], options['skew']).generate(
+            options['users'], options['recipes'], options['favorites'],
+            options['cart'], options['subscriptions']
+        )
+        self.stderr.write(
+            f'Данные созданы за {time.perf_counter() - started:.1f} с'
+        )
+
+    def get_scenarios(self):
+        """Сценарии измерения: имя, адрес и признак авторизации"""
+        user = User.objects.filter(favorites__isnull=False).first()
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        tag = Tag.objects.first()
+        prefix = Ingredient.objects.values_list('name', flat=True).first()
+        return [
+            ('recipe-list-anonymous', f'{API_URL}recipes/', None),
+            ('recipe-list', f'{API_URL}recipes/', user),
+            ('recipe-list-filtered',
+             f'{API_URL}recipes/?tags={tag.slug}&is_favorited=1', user),
+            ('recipe-detail', f'{API_URL}recipes/{recipe.pk}/', user),
+            ('subscriptions',
+             f'{API_URL}users/subscriptions/?recipes_limit=3', user),
+            ('subscription-feed', f'{API_URL}recipes/feed/', user),
+            ('ingredient-search',
+             f'{API_URL}ingredients/?name={prefix[:3]}', None),
+            ('shopping-list-download',
+             f'{API_URL}recipes/download_shopping_cart/', user),
+        ]
+
+    def measure(self, client, url, repeat, warmup):
+        """
+        Времена ответа и количество SQL-запросов измеряемых (не прогревочных)
+        запросов: queries - наибольшее, queries_min - наименьшее за запрос
+        """
+        durations = []
+        query_counts = []
+        for iteration in range(warmup + repeat):
+            timer = QueryTimer()
+            started = time.perf_counter()
+            with connection.execute_wrapper(timer):
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if iteration >= warmup:
+                durations.append(time.perf_counter() - started)
+                query_counts.append(timer.count)
+        return {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': _milliseconds(percentile(durations, 0.5)),
+            'p95_ms': _milliseconds(percentile(durations, 0.95)),
+            'mean_ms': _milliseconds(sum(durations) / len(durations)),
+            'queries': max(query_counts),
+            'queries_min': min(query_counts),
+        }
+
+    def run(self, options):
+        self.seed(options)
+        cache.clear()
+        results = {}
+        for name, url, user in self.get_scenarios():
+            client = Client()
+            if user is not None:
+                token, _ = Token.objects.get_or_create(user=user)
+                client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+            results[name] = self.measure(
+                client, url, options['repeat'], options['warmup']
+            )
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'cart': ShoppingCart.objects.count(),
+                'subscriptions': Subscription.objects.count(),
+                'seed': options['seed'],
+                'skew': options['skew'],
+            },
+            'repeat': options['repeat'],
+            'results': results,
+        }
+
+    @staticmethod
+    def compare(baseline, results):
+        """Отношения времен и разница количества запросов к базовому отчету"""
+        comparison = {}
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            comparison[name] = {
+                'p50_ratio': round(result['p50_ms'] / previous['p50_ms'], 3),
+                'p95_ratio': round(result['p95_ms'] / previous['p95_ms'], 3),
+                'queries_delta': result['queries'] - previous['queries'],
+            }
+        return comparison
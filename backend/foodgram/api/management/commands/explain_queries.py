@@ -0,0 +1,185 @@
+"""Модуль проверки планов выполнения частых запросов
+
+Команда строит запросы, которые выполняют основные адреса API, теми же
+представлениями и фильтрами, и выводит их планы выполнения (EXPLAIN, а
+в PostgreSQL с ключом --analyze - EXPLAIN ANALYZE). В планах отмечаются
+последовательное чтение таблиц и сортировка с выгрузкой на диск (только
+при --analyze в PostgreSQL). Ключ --strict завершает команду с ошибкой,
+если отмечен хотя бы один запрос, что позволяет проверять индексы в CI.
+"""
+import re
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.filters import RecipeFilter
+from api.pagination import RecipePagination
+from api.views import RecipeViewSet, SubscriptionsViewSet
+from recipes.feed import FEED_ORDERING, get_feed
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            Tag, User)
+from recipes.search import search_recipes
+from recipes.services import get_shopping_list
+from users.models import Subscription
+
+PAGE_SIZE = RecipePagination.page_size
+# Признаки проблем в тексте плана по СУБД: название и шаблон строки плана
+PLAN_ISSUES = {
+    'postgresql': (
+        ('seq scan', re.compile(r'Seq Scan on (\w+)')),
+        ('sort spill', re.compile(r'Sort Method: external')),
+    ),
+    'sqlite': (
+        ('seq scan', re.compile(r'\bSCAN (?:TABLE )?(\w+)$')),
+    ),
+}
+
+
+def _view_queryset(view_class, user):
+    view = view_class()
+    view.request = SimpleNamespace(user=user)
+    return view.get_queryset()
+
+
+def _recipe_list(user, **params):
+    """Первая страница списка рецептов с параметрами фильтрации"""
+    return RecipeFilter(
+        params, queryset=_view_queryset(RecipeViewSet, user),
+        request=SimpleNamespace(user=user)
+    ).qs.order_by(*RecipeViewSet.cursor_ordering)[:PAGE_SIZE]
+
+
+def get_hot_queries(user, author, recipe, tag):
+    """Частые запросы API по именам"""
+    recipe_ids = list(_recipe_list(user).values_list('pk', flat=True))
+    return OrderedDict([
+        ('recipe-list', _recipe_list(user)),
+        ('recipe-list-author', _recipe_list(user, author=author.pk)),
+        ('recipe-list-tags', _recipe_list(user, tags=[tag.slug])),
+        ('recipe-list-favorited', _recipe_list(user, is_favorited='1')),
+        ('recipe-list-in-cart', _recipe_list(user, is_in_shopping_cart='1')),
+        ('recipe-search', search_recipes(
+            _view_queryset(RecipeViewSet, user), recipe.name
+        )[:PAGE_SIZE]),
+        ('subscription-feed', get_feed(
+            user, _view_queryset(RecipeViewSet, user)
+        ).order_by(*FEED_ORDERING)[:PAGE_SIZE]),
+        ('recipe-ingredients', RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id', 'amount')),
+        ('user-favorites', Favorite.objects.filter(user=user)
+         .values_list('recipe_id', flat=True)),
+        ('user-cart', ShoppingCart.objects.filter(user=user)
+         .values_list('recipe_id', flat=True)),
+        ('user-subscriptions', Subscription.objects.filter(subscriber=user)
+         .values_list('author_id', flat=True)),
+        ('favorite-exists', Favorite.objects.filter(
+            user=user, recipe=recipe
+        )),
+        ('subscriptions', _view_queryset(SubscriptionsViewSet, user)
+         [:PAGE_SIZE]),
+        ('author-latest-recipes', Recipe.objects.filter(author=author)
+         .order_by(*RecipeViewSet.cursor_ordering)[:3]),
+        ('shopping-list', get_shopping_list(user)),
+    ])
+
+
+def find_issues(plan, vendor):
+    """Отмеченные строки плана: список пар (признак, строка)"""
+    issues = []
+    for line in plan.splitlines():
+        for name, pattern in PLAN_ISSUES.get(vendor, ()):
+            if pattern.search(line.strip()):
+                issues.append((name, line.strip()))
+    return issues
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints query plans of frequent API queries and flags sequential '
+        'scans and sorts spilling to disk'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries', nargs='*', metavar='query',
+            help='Names of the queries to explain (all by default)'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Execute the queries and report actual times (PostgreSQL)'
+        )
+        parser.add_argument(
+            '--ignore', action='append', default=[], metavar='TABLE',
+            help='Do not flag sequential scans of the table, '
+                 'e.g. small reference tables'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Exit with an error if any query is flagged'
+        )
+
+    def get_options(self, options):
+        if not options['analyze']:
+            return {}
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'EXPLAIN ANALYZE поддерживается только для PostgreSQL.'
+            )
+        return {'analyze': True, 'buffers': True}
+
+    def get_queries(self, names):
+        user = (
+            User.objects.filter(favorites__isnull=False).first()
+            or User.objects.first()
+        )
+        author = User.objects.order_by('-recipes_count').first()
+        recipe = Recipe.objects.first()
+        tag = Tag.objects.first()
+        if None in (user, author, recipe, tag):
+            raise CommandError(
+                'Для построения запросов нужны пользователи, рецепты и теги.'
+            )
+        queries = get_hot_queries(user, author, recipe, tag)
+        unknown = set(names) - set(queries)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные запросы: {", ".join(sorted(unknown))}. '
+                f'Доступны: {", ".join(queries)}.'
+            )
+        if names:
+            return OrderedDict(
+                (name, queries[name]) for name in queries if name in names
+            )
+        return queries
+
+    def handle(self, *args, **options):
+        explain_options = self.get_options(options)
+        ignored = set(options['ignore'])
+        flagged = []
+        for name, queryset in self.get_queries(options['queries']).items():
+            plan = queryset.explain(**explain_options)
+            issues = [
+                (issue, line) for issue, line in find_issues(
+                    plan, connection.vendor
+                )
+                if not (issue == 'seq scan' and any(
+                    re.search(rf'\b{table}\b', line) for table in ignored
+                ))
+            ]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            for issue, line in issues:
+                self.stdout.write(self.style.WARNING(f'  {issue}: {line}'))
+            if issues:
+                flagged.append(name)
+            self.stdout.write('')
+        if flagged:
+            message = f'Отмечены запросы: {", ".join(flagged)}'
+            if options['strict']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('Отмеченных запросов нет'))
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False, verbose_name='ключ')),
+                ('full_at', models.FloatField(verbose_name='момент полного восстановления')),
+            ],
+            options={
+                'verbose_name': 'ограничитель частоты запросов',
+                'verbose_name_plural': 'ограничители частоты запросов',
+            },
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class ThrottleBucket(models.Model):
+    """Состояние ограничителя частоты запросов для одного ключа"""
+    key = models.CharField('ключ', max_length=200, primary_key=True)
+    full_at = models.FloatField('момент полного восстановления')
+
+    class Meta:
+        verbose_name = 'ограничитель частоты запросов'
+        verbose_name_plural = 'ограничители частоты запросов'
+
+    def __str__(self) -> str:
+        return self.key
@@ -1,7 +1,117 @@
 """"Модуль специализированных классов пагинации"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class RecipePagination(PageNumberPagination):
+    """
+    Постраничный вывод с номером страницы, а при наличии в запросе
+    параметра cursor - по ключу сортировки.
+
+    В режиме курсора запрос страницы не зависит от ее глубины и не
+    подсчитывает общее количество записей. Первая страница запрашивается
+    с пустым cursor, следующие - по ссылке next из ответа.
+    Поля ключа берутся из атрибута cursor_ordering представления.
+    """
     page_size_query_param = 'limit'
     page_size = 5
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-edited', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(queryset, request)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+        results = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            self.next_position = [
+                getattr(results[-1], field.lstrip('-'))
+                for field in self.ordering
+            ]
+        return results
+
+    def position_filter(self, position):
+        """Условие отбора записей, следующих за позицией курсора"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, queryset, request):
+        """Позиция курсора из параметра запроса"""
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            values = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self._ordering_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _ordering_field(queryset, field):
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def encode_cursor(position):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode('ascii')
+        ).decode('ascii')
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,48 @@
+"""Классы представления списка покупок в виде файлов"""
+from rest_framework import exceptions, negotiation, renderers
+
+from .services import iter_csv, iter_txt
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Базовый класс представления списка покупок.
+
+    Список передается потоком через stream(); render() используется
+    только для ответов с ошибками.
+    """
+    charset = 'utf-8'
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode(self.charset)
+
+    def stream(self, shopping_list):
+        for chunk in self.generator(shopping_list):
+            yield chunk.encode(self.charset)
+
+
+class TxtShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    generator = staticmethod(iter_txt)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    generator = staticmethod(iter_csv)
+
+
+class ShoppingListNegotiation(negotiation.DefaultContentNegotiation):
+    """
+    Выбор формата по параметру format или заголовку Accept. При
+    неподходящем заголовке Accept выдается формат по умолчанию.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except exceptions.NotAcceptable:
+            return renderers[0], renderers[0].media_type
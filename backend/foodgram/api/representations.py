@@ -0,0 +1,113 @@
+"""Быстрое представление рецептов и пользователей для чтения
+
+Повторяет формат ответов сериализаторов рецептов и пользователей без
+создания сериализатора и привязки полей для каждого объекта. Функции
+получения полей собираются один раз для запроса, после чего объекты
+с заранее выбранными связанными записями превращаются в словари.
+"""
+from operator import attrgetter
+
+from .context import UserContext
+from .fields import get_variant_urls
+
+
+class Representation:
+    """Представление объекта словарем по парам (ключ, функция получения)"""
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+    def __call__(self, instance):
+        if instance is None:
+            return None
+        return {key: get(instance) for key, get in self.fields}
+
+    def many(self, instances):
+        return [self(instance) for instance in instances]
+
+
+def related(name, representation):
+    """Получение представлений объектов связи многие-ко-многим"""
+    get_manager = attrgetter(name)
+    return lambda instance: representation.many(get_manager(instance).all())
+
+
+def image_url(name, request):
+    """Получение ссылки на файл изображения"""
+    get_image = attrgetter(name)
+
+    def get(instance):
+        image = get_image(instance)
+        if not image:
+            return None
+        if request is None:
+            return image.url
+        return request.build_absolute_uri(image.url)
+    return get
+
+
+TAG = Representation(
+    (key, attrgetter(key)) for key in ('id', 'name', 'color', 'slug')
+)
+
+RECIPE_INGREDIENT = Representation((
+    ('id', attrgetter('ingredient.id')),
+    ('name', attrgetter('ingredient.name')),
+    ('measurement_unit', attrgetter('ingredient.measurement_unit.notation')),
+    ('amount', attrgetter('amount')),
+))
+
+
+def user_fields(user_context):
+    return (
+        ('email', attrgetter('email')),
+        ('id', attrgetter('id')),
+        ('username', attrgetter('username')),
+        ('first_name', attrgetter('first_name')),
+        ('last_name', attrgetter('last_name')),
+        ('is_subscribed',
+         lambda user: user.pk in user_context.subscription_ids),
+    )
+
+
+def user_representation(user_context, extra_fields=()):
+    """Представление пользователя в формате UserSerializer"""
+    return Representation(user_fields(user_context) + tuple(extra_fields))
+
+
+def recipe_short_representation(request):
+    """Представление рецепта в формате RecipeShortSerializer"""
+    return Representation((
+        ('id', attrgetter('id')),
+        ('name', attrgetter('name')),
+        ('image', image_url('image', request)),
+        ('images', lambda recipe: get_variant_urls(recipe, request)),
+        ('cooking_time', attrgetter('cooking_time')),
+    ))
+
+
+def recipe_representation(request, user_context=None):
+    """
+    Представление рецепта в формате RecipeSerializer. Теги и ингредиенты
+    рецептов должны быть выбраны заранее.
+    """
+    user_context = user_context or UserContext()
+    author = user_representation(user_context)
+    get_author = attrgetter('author')
+    return Representation((
+        ('id', attrgetter('id')),
+        ('tags', related('tags', TAG)),
+        ('author', lambda recipe: author(get_author(recipe))),
+        ('is_in_shopping_cart',
+         lambda recipe: recipe.pk in user_context.cart_ids),
+        ('is_favorited',
+         lambda recipe: recipe.pk in user_context.favorite_ids),
+        ('ingredients', related('recipe_to_ingredients', RECIPE_INGREDIENT)),
+        ('name', attrgetter('name')),
+        ('image', image_url('image', request)),
+        ('images', lambda recipe: get_variant_urls(recipe, request)),
+        ('text', attrgetter('text')),
+        ('cooking_time', attrgetter('cooking_time')),
+        ('favorites_count', attrgetter('favorites_count')),
+        ('in_cart_count', attrgetter('in_cart_count')),
+    ))
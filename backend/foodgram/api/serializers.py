@@ -1,13 +1,25 @@
+from operator import attrgetter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
+from django.utils.functional import cached_property
 from djoser import serializers as djoser_serialziers
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.services import (change_recipe_in_shopping_lists,
+                              get_latest_recipes)
 from users.models import Subscription
-from .fields import DecodingImageField
+from .context import get_user_context
+from .fields import DecodingImageField, ImageVariantsField
+from .fragments import load_fragments
+from .representations import (recipe_representation,
+                              recipe_short_representation,
+                              user_representation)
 from .utils import URLParameter
 from .validators import NotEqualValidator
 
@@ -16,6 +28,7 @@ User = get_user_model()
 
 class UserSerializer(djoser_serialziers.UserSerializer):
     """Сериализатор пользователя"""
+    # Filled in by user_representation() from the user context
     is_subscribed = serializers.BooleanField(read_only=True)
 
     class Meta(djoser_serialziers.UserSerializer):
@@ -25,6 +38,15 @@ class UserSerializer(djoser_serialziers.UserSerializer):
             + ('username', 'first_name', 'last_name', 'is_subscribed')
         )
 
+    @cached_property
+    def representation(self):
+        return user_representation(
+            get_user_context(self.context.get('request'))
+        )
+
+    def to_representation(self, instance):
+        return self.representation(instance)
+
 
 class UserCreateSerializer(djoser_serialziers.UserCreateSerializer):
     """Сериализатор создания пользователя"""
@@ -75,22 +97,49 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Краткая форма сериализатора рецептов"""
+    images = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+    @cached_property
+    def representation(self):
+        return recipe_short_representation(self.context.get('request'))
+
+    def to_representation(self, instance):
+        return self.representation(instance)
+
+
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов с общей выборкой их представлений"""
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return [
+            self.child.personalize(recipe, fragment)
+            for recipe, fragment in zip(
+                recipes, self.child.load_fragments(recipes)
+            )
+        ]
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    """Развернутая форма сериализатора рецептов"""
+    """
+    Развернутая форма сериализатора рецептов. Представление, общее для
+    всех пользователей, берется из кеша и дополняется признаками текущего
+    пользователя и счетчиками.
+    """
     author = UserSerializer(
         read_only=True,
         default=serializers.CurrentUserDefault()
     )
     image = DecodingImageField()
+    images = ImageVariantsField()
     ingredients = RecipeIngredientSerializer(
         many=True,
         source='recipe_to_ingredients'
     )
+    # Filled in by personalize() from the user context
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
     is_favorited = serializers.BooleanField(read_only=True)
 
@@ -98,8 +147,15 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'is_in_shopping_cart', 'is_favorited',
-            'ingredients', 'name', 'image', 'text', 'cooking_time'
+            'ingredients', 'name', 'image', 'images', 'text',
+            'cooking_time', 'favorites_count', 'in_cart_count'
         )
+        read_only_fields = ('favorites_count', 'in_cart_count')
+        list_serializer_class = RecipeFragmentListSerializer
+
+    prefetch_lookups = (
+        'tags', 'recipe_to_ingredients__ingredient__measurement_unit'
+    )
 
     def validate(self, attrs):
         unique_ingredients = set(
@@ -109,23 +165,89 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Повторяющийся ингредиент')
         return attrs
 
-    def to_representation(self, instance):
-        """Генератор представления с развернутым отображением тегов"""
-        representation = super().to_representation(instance)
-        representation['tags'] = TagSerializer(instance.tags, many=True).data
+    def build_fragments(self, recipes):
+        """
+        Общие для всех пользователей представления рецептов с выборкой
+        тегов и ингредиентов
+        """
+        prefetch_related_objects(recipes, *self.prefetch_lookups)
+        return recipe_representation(self.context.get('request')).many(
+            recipes
+        )
+
+    def load_fragments(self, recipes):
+        return load_fragments(
+            recipes, self.build_fragments, self.context.get('request')
+        )
+
+    def personalize(self, instance, fragment):
+        """Дополнение представления признаками пользователя и счетчиками"""
+        user_context = get_user_context(self.context.get('request'))
+        representation = fragment.copy()
+        representation.update({
+            'is_in_shopping_cart': instance.pk in user_context.cart_ids,
+            'is_favorited': instance.pk in user_context.favorite_ids,
+            'favorites_count': instance.favorites_count,
+            'in_cart_count': instance.in_cart_count,
+        })
+        author = representation['author']
+        if author is not None:
+            author = author.copy()
+            author['is_subscribed'] = (
+                author['id'] in user_context.subscription_ids
+            )
+            representation['author'] = author
         return representation
 
-    def _add_ingredients(self, recipe_items, recipe):
-        """Добавление элементов к списку ингредментов рецепта"""
-        for item in recipe_items:
-            recipe.recipe_to_ingredients.create(**item)
+    def to_representation(self, instance):
+        return self.personalize(instance, self.load_fragments([instance])[0])
+
+    def _set_ingredients(self, recipe, recipe_items):
+        """
+        Приведение состава рецепта к recipe_items: удаление лишних,
+        изменение количества и добавление новых ингредиентов постоянным
+        числом запросов. Неизменные записи сохраняют первичные ключи.
+        Возвращает прежние количества ингредиентов.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        submitted = {
+            item['ingredient'].pk: item['amount'] for item in recipe_items
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = submitted.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        removed = [
+            item.pk for ingredient_id, item in current.items()
+            if ingredient_id not in submitted
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in submitted.items()
+            if ingredient_id not in current
+        )
+        return old_amounts
 
     @transaction.atomic
     def create(self, validated_data):
         """Создание записи с обработкой вложенных данных по ингредиентам"""
         recipe_items = validated_data.pop('recipe_to_ingredients')
         recipe = super().create(validated_data)
-        self._add_ingredients(recipe_items, recipe)
+        self._set_ingredients(recipe, recipe_items)
         return recipe
 
     @transaction.atomic
@@ -133,15 +255,17 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Обновление записи с обработкой вложенных данных по ингредиентам"""
         recipe_items = validated_data.pop('recipe_to_ingredients')
         instance = super().update(instance, validated_data)
-        instance.recipe_to_ingredients.all().delete()
-        self._add_ingredients(recipe_items, instance)
+        old_amounts = self._set_ingredients(instance, recipe_items)
+        change_recipe_in_shopping_lists(instance, old_amounts, {
+            item['ingredient'].pk: item['amount'] for item in recipe_items
+        })
         return instance
 
 
 class RecipeListSerializer(serializers.ModelSerializer):
     """Базовый сериализатор добавления рецепта к списку рецептов"""
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    recipe = serializers.HiddenField(default=URLParameter('recipe_id'))
+    recipe = serializers.HiddenField(default=URLParameter('pk'))
 
     class Meta:
         fields = ('user', 'recipe')
@@ -169,21 +293,74 @@ class FavoritesSerializer(RecipeListSerializer):
         )]
 
 
+class BatchSerializer(serializers.Serializer):
+    """Сериализатор списка идентификаторов пакетной операции"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPES['BATCH_SIZE']
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class UserRecipeListSerializer(serializers.ListSerializer):
+    """Сериализатор списка авторов с общей выборкой их рецептов"""
+    def to_representation(self, data):
+        authors = list(data.all() if isinstance(data, Manager) else data)
+        self.child.prefetch_recipes(authors)
+        return super().to_representation(authors)
+
+
 class UserRecipeSerializer(UserSerializer):
     """Сериализатор пользователя и его рецептов"""
     recipes = serializers.SerializerMethodField(read_only=True)
     recipes_count = serializers.IntegerField(read_only=True)
 
+    @cached_property
+    def recipes_limit(self):
+        value = self.context.get('request').query_params.get(
+            'recipes_limit', 0
+        )
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Требуется целое число.'}
+            )
+
+    def prefetch_recipes(self, authors):
+        """Выборка последних рецептов для всех авторов одним запросом"""
+        self._latest_recipes = get_latest_recipes(
+            [author.pk for author in authors],
+            self.recipes_limit,
+            ('name', 'image', 'images_ready', 'cooking_time')
+        )
+
     def get_recipes(self, obj):
-        recipes_limit = int(
-            self.context.get('request').query_params.get('recipes_limit', 0)
+        latest_recipes = getattr(self, '_latest_recipes', {})
+        if obj.pk not in latest_recipes:
+            self.prefetch_recipes([obj])
+            latest_recipes = self._latest_recipes
+        return self.recipe_representation.many(latest_recipes[obj.pk])
+
+    @cached_property
+    def recipe_representation(self):
+        return recipe_short_representation(None)
+
+    @cached_property
+    def representation(self):
+        return user_representation(
+            get_user_context(self.context.get('request')), (
+                ('recipes', self.get_recipes),
+                ('recipes_count', attrgetter('recipes_count')),
+            )
         )
-        return RecipeShortSerializer(
-            obj.recipes.all()[:recipes_limit], many=True
-        ).data
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
+        list_serializer_class = UserRecipeListSerializer
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -191,7 +368,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     subscriber = serializers.HiddenField(
         default=serializers.CurrentUserDefault()
     )
-    author = serializers.HiddenField(default=URLParameter('user_id'))
+    author = serializers.HiddenField(default=URLParameter('id'))
 
     class Meta:
         model = Subscription
@@ -1,23 +1,61 @@
-from django.core.files.base import ContentFile
-
-LIST_ITEM = '- {name}: {amount} {unit}'
-LIST = """
-           Ваш список покупок\r\n
-{ingredients}
-"""
-
-
-def render_txt(shopping_list: list, filename: str):
-    ingredient_text = '\r\n'.join(
-        LIST_ITEM.format(
-            name=item['ingredient_name'],
-            unit=item['unit'],
-            amount=item['total_amount']
-        ) for item in shopping_list
-    )
-    return ContentFile(
-        LIST.format(
-            ingredients=ingredient_text
-        ).encode(encoding='utf-8'),
-        f'{filename}.txt'
-    )
+"""Формирование файлов списка покупок
+
+Генераторы принимают итерируемые строки списка покупок и выдают текст
+порциями, не накапливая документ целиком в памяти.
+"""
+import csv
+
+LIST_ITEM = '- {name}: {amount} {unit}'
+LIST_HEADER = '\n           Ваш список покупок\r\n\n'
+LIST_SEPARATOR = '\r\n'
+LIST_FOOTER = '\n'
+CSV_BOM = '\ufeff'
+CSV_HEADERS = ('Ингредиент', 'Единица измерения', 'Количество')
+CHUNK_ROWS = 100
+
+
+def _chunks(lines, size=CHUNK_ROWS):
+    """Объединение строк в порции по size строк"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_txt(shopping_list):
+    """Список покупок в текстовом формате"""
+    def lines():
+        yield LIST_HEADER
+        separator = ''
+        for item in shopping_list:
+            yield separator + LIST_ITEM.format(
+                name=item['ingredient_name'],
+                unit=item['unit'],
+                amount=item['total_amount']
+            )
+            separator = LIST_SEPARATOR
+        yield LIST_FOOTER
+    return _chunks(lines())
+
+
+class _Line:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+    def write(self, value):
+        return value
+
+
+def iter_csv(shopping_list):
+    """Список покупок в формате CSV"""
+    writer = csv.writer(_Line())
+
+    def lines():
+        yield CSV_BOM + writer.writerow(CSV_HEADERS)
+        for item in shopping_list:
+            yield writer.writerow(
+                (item['ingredient_name'], item['unit'], item['total_amount'])
+            )
+    return _chunks(lines())
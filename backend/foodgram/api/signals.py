@@ -0,0 +1,48 @@
+"""Обработчики сигналов, влияющих на кешированные данные API"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+from .authentication import invalidate_tokens
+from .context import invalidate_user_contexts
+from .fragments import invalidate_author_fragments
+
+User = get_user_model()
+
+LOGIN_FIELDS = frozenset({'last_login'})
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw, update_fields, **kwargs):
+    """
+    Сброс представлений рецептов после изменения профиля автора и
+    кешированных данных аутентификации после смены пароля или блокировки
+    """
+    if created or raw or update_fields == LOGIN_FIELDS:
+        return
+    invalidate_author_fragments(instance)
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_list_changed(sender, instance, **kwargs):
+    invalidate_user_contexts([instance.user_id])
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_user_contexts([instance.subscriber_id])
@@ -0,0 +1,398 @@
+"""Тесты API
+
+Рецепты и пользователи отдаются функциями api.representations, минуя
+поля сериализаторов. Тесты соответствия сравнивают байты ответа с выводом
+эталонных сериализаторов, которые строят представление через поля DRF так
+же, как до появления быстрых представлений. Пакетные операции со списками
+и подписками проверяются вместе с одиночными: статусы, счетчики и списки
+покупок должны совпадать.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag, Unit)
+from users.models import Subscription
+from .context import UserContext, get_user_context
+from .serializers import (RecipeSerializer, RecipeShortSerializer,
+                          TagSerializer, UserRecipeSerializer,
+                          UserSerializer)
+
+User = get_user_model()
+
+
+class ReferenceUserSerializer(UserSerializer):
+    is_subscribed = serializers.SerializerMethodField()
+
+    def get_is_subscribed(self, obj):
+        user_context = get_user_context(self.context.get('request'))
+        return obj.pk in user_context.subscription_ids
+
+    def to_representation(self, instance):
+        return serializers.ModelSerializer.to_representation(self, instance)
+
+
+class ReferenceRecipeShortSerializer(RecipeShortSerializer):
+    def to_representation(self, instance):
+        return serializers.ModelSerializer.to_representation(self, instance)
+
+
+class ReferenceRecipeSerializer(RecipeSerializer):
+    author = ReferenceUserSerializer(read_only=True)
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.SerializerMethodField()
+
+    def get_is_in_shopping_cart(self, obj):
+        user_context = get_user_context(self.context.get('request'))
+        return obj.pk in user_context.cart_ids
+
+    def get_is_favorited(self, obj):
+        user_context = get_user_context(self.context.get('request'))
+        return obj.pk in user_context.favorite_ids
+
+    def to_representation(self, instance):
+        representation = serializers.ModelSerializer.to_representation(
+            self, instance
+        )
+        representation['tags'] = TagSerializer(instance.tags, many=True).data
+        return representation
+
+
+class ReferenceUserRecipeSerializer(UserRecipeSerializer):
+    is_subscribed = serializers.SerializerMethodField()
+
+    def get_is_subscribed(self, obj):
+        user_context = get_user_context(self.context.get('request'))
+        return obj.pk in user_context.subscription_ids
+
+    def get_recipes(self, obj):
+        self.prefetch_recipes([obj])
+        return ReferenceRecipeShortSerializer(
+            self._latest_recipes[obj.pk], many=True
+        ).data
+
+    def to_representation(self, instance):
+        return serializers.ModelSerializer.to_representation(self, instance)
+
+
+class RepresentationParityTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(notation='г')
+        apple = Ingredient.objects.create(name='Яблоко', measurement_unit=unit)
+        flour = Ingredient.objects.create(name='Мука', measurement_unit=unit)
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        Tag.objects.create(name='Ужин', slug='dinner')
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass',
+            first_name='Читатель', last_name='Первый'
+        )
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass',
+            first_name='', last_name='Автор'
+        )
+        User.objects.create_user(
+            username='other', email='other@example.com', password='pass'
+        )
+        pie = Recipe.objects.create(
+            author=author, name='Пирог', text='Испечь',
+            image='recipes/pie.png', cooking_time=40, images_ready=True
+        )
+        pie.tags.set([breakfast])
+        RecipeIngredient.objects.create(
+            recipe=pie, ingredient=apple, amount=3
+        )
+        RecipeIngredient.objects.create(
+            recipe=pie, ingredient=flour, amount=200
+        )
+        Recipe.objects.create(
+            author=author, name='Яблоко', text='Вымыть',
+            image='recipes/apple.png', cooking_time=1
+        )
+        Recipe.objects.create(
+            author=None, name='Без автора', text='Текст',
+            image='recipes/orphan.png', cooking_time=5
+        )
+        Favorite.objects.create(user=cls.reader, recipe=pie)
+        ShoppingCart.objects.create(user=cls.reader, recipe=pie)
+        Subscription.objects.create(subscriber=cls.reader, author=author)
+
+    def make_request(self, user=None, **params):
+        request = Request(
+            APIRequestFactory().get('/api/v1/users/subscriptions/', params)
+        )
+        if user is not None:
+            request.user = user
+        return request
+
+    def contexts(self):
+        return {
+            'без запроса': {},
+            'аноним': {'request': self.make_request()},
+            'пользователь': {'request': self.make_request(self.reader)},
+        }
+
+    def assertSameJSON(self, first, second):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(first), renderer.render(second))
+
+    def test_recipes(self):
+        for name, context in self.contexts().items():
+            with self.subTest(context=name):
+                recipes = Recipe.objects.select_related('author')
+                self.assertSameJSON(
+                    RecipeSerializer(recipes, many=True, context=context).data,
+                    [
+                        ReferenceRecipeSerializer(recipe, context=context).data
+                        for recipe in recipes
+                    ]
+                )
+
+    def test_short_recipes(self):
+        for name, context in self.contexts().items():
+            with self.subTest(context=name):
+                recipes = Recipe.objects.all()
+                self.assertSameJSON(
+                    RecipeShortSerializer(
+                        recipes, many=True, context=context
+                    ).data,
+                    ReferenceRecipeShortSerializer(
+                        recipes, many=True, context=context
+                    ).data
+                )
+
+    def test_users(self):
+        for name, context in self.contexts().items():
+            with self.subTest(context=name):
+                users = User.objects.order_by('pk')
+                self.assertSameJSON(
+                    UserSerializer(users, many=True, context=context).data,
+                    ReferenceUserSerializer(
+                        users, many=True, context=context
+                    ).data
+                )
+
+    def test_users_with_recipes(self):
+        for limit in ('0', '1', '5'):
+            with self.subTest(recipes_limit=limit):
+                context = {
+                    'request': self.make_request(
+                        self.reader, recipes_limit=limit
+                    )
+                }
+                users = User.objects.order_by('pk')
+                self.assertSameJSON(
+                    UserRecipeSerializer(
+                        users, many=True, context=context
+                    ).data,
+                    ReferenceUserRecipeSerializer(
+                        users, many=True, context=context
+                    ).data
+                )
+
+
+@override_settings(
+    RECIPES={**settings.RECIPES, 'USER_CONTEXT_TIMEOUT': 60}
+)
+class UserContextInvalidationTest(TransactionTestCase):
+    """Сброс кешированного контекста при изменениях вне представлений"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        # bulk_create skips the post_save image processing
+        Recipe.objects.bulk_create([Recipe(
+            author=self.author, name='Пирог', text='Испечь',
+            image='recipes/pie.png', cooking_time=40
+        )])
+        self.recipe = Recipe.objects.get()
+
+    def context(self):
+        return UserContext.for_user(self.user)
+
+    def test_recipe_lists(self):
+        self.assertFalse(self.context().favorite_ids)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(self.context().favorite_ids, {self.recipe.pk})
+        self.assertEqual(self.context().cart_ids, {self.recipe.pk})
+        self.recipe.delete()
+        self.assertFalse(self.context().favorite_ids)
+        self.assertFalse(self.context().cart_ids)
+
+    def test_subscriptions(self):
+        self.assertFalse(self.context().subscription_ids)
+        Subscription.objects.create(subscriber=self.user, author=self.author)
+        self.assertEqual(self.context().subscription_ids, {self.author.pk})
+        self.author.delete()
+        self.assertFalse(self.context().subscription_ids)
+
+
+@override_settings(THROTTLE={**settings.THROTTLE, 'ENABLED': False})
+class RecipeListsApiTest(TestCase):
+    """Пакетные и одиночные изменения избранного, корзины и подписок"""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(notation='г')
+        apple = Ingredient.objects.create(name='Яблоко', measurement_unit=unit)
+        flour = Ingredient.objects.create(name='Мука', measurement_unit=unit)
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.pie = Recipe.objects.create(
+            author=cls.author, name='Пирог', text='Испечь',
+            image='recipes/pie.png', cooking_time=40
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.pie, ingredient=apple, amount=3
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.pie, ingredient=flour, amount=200
+        )
+        cls.salad = Recipe.objects.create(
+            author=cls.author, name='Салат', text='Нарезать',
+            image='recipes/salad.png', cooking_time=5
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.salad, ingredient=apple, amount=2
+        )
+        cls.apple, cls.flour = apple, flour
+        cls.missing = 10 ** 6
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            result['id']: result['status']
+            for result in response.json()['results']
+        }
+
+    def counts(self, field):
+        return dict(Recipe.objects.values_list('pk', field))
+
+    def shopping_list(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user)
+            .values_list('ingredient_id', 'amount')
+        )
+
+    def test_favorite_batch(self):
+        url = '/api/v1/recipes/favorite/'
+        Favorite.objects.create(user=self.user, recipe=self.salad)
+        self.assertEqual(
+            self.batch(
+                'post', url, [self.pie.pk, self.salad.pk, self.missing]
+            ),
+            {
+                self.pie.pk: 'added', self.salad.pk: 'exists',
+                self.missing: 'not_found'
+            }
+        )
+        self.assertEqual(
+            self.counts('favorites_count'), {self.pie.pk: 1, self.salad.pk: 1}
+        )
+        self.assertEqual(
+            self.batch('delete', url, [self.pie.pk, self.missing]),
+            {self.pie.pk: 'removed', self.missing: 'not_found'}
+        )
+        self.assertEqual(
+            self.batch('delete', url, [self.pie.pk]), {self.pie.pk: 'absent'}
+        )
+        self.assertEqual(
+            self.counts('favorites_count'), {self.pie.pk: 0, self.salad.pk: 1}
+        )
+        self.assertEqual(
+            set(Favorite.objects.values_list('recipe_id', flat=True)),
+            {self.salad.pk}
+        )
+
+    def test_shopping_cart_batch(self):
+        url = '/api/v1/recipes/shopping_cart/'
+        self.assertEqual(
+            self.batch('post', url, [self.pie.pk, self.salad.pk]),
+            {self.pie.pk: 'added', self.salad.pk: 'added'}
+        )
+        self.assertEqual(
+            self.batch('post', url, [self.pie.pk]), {self.pie.pk: 'exists'}
+        )
+        self.assertEqual(
+            self.counts('in_cart_count'), {self.pie.pk: 1, self.salad.pk: 1}
+        )
+        self.assertEqual(
+            self.shopping_list(), {self.apple.pk: 5, self.flour.pk: 200}
+        )
+        self.assertEqual(
+            self.batch('delete', url, [self.pie.pk]), {self.pie.pk: 'removed'}
+        )
+        self.assertEqual(
+            self.counts('in_cart_count'), {self.pie.pk: 0, self.salad.pk: 1}
+        )
+        self.assertEqual(self.shopping_list(), {self.apple.pk: 2})
+
+    def test_subscribe_batch(self):
+        url = '/api/v1/users/subscribe/'
+        self.assertEqual(
+            self.batch(
+                'post', url, [self.author.pk, self.user.pk, self.missing]
+            ),
+            {
+                self.author.pk: 'added', self.user.pk: 'invalid',
+                self.missing: 'not_found'
+            }
+        )
+        self.assertEqual(
+            self.batch('post', url, [self.author.pk]),
+            {self.author.pk: 'exists'}
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(
+            self.batch('delete', url, [self.author.pk, self.user.pk]),
+            {self.author.pk: 'removed', self.user.pk: 'invalid'}
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_single_duplicates(self):
+        urls = (
+            f'/api/v1/recipes/{self.pie.pk}/favorite/',
+            f'/api/v1/recipes/{self.pie.pk}/shopping_cart/',
+            f'/api/v1/users/{self.author.pk}/subscribe/',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+        self.pie.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.pie.favorites_count, 1)
+        self.assertEqual(self.pie.in_cart_count, 1)
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(
+            self.shopping_list(), {self.apple.pk: 3, self.flour.pk: 200}
+        )
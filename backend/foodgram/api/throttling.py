@@ -0,0 +1,210 @@
+"""Ограничение частоты запросов по алгоритму маркерной корзины
+
+Корзина вмещает столько маркеров, сколько запросов разрешено за период,
+и пополняется равномерно. Вместо числа маркеров хранится момент, когда
+корзина снова станет полной (GCRA): это одно число на ключ, и проверка
+запроса - одно чтение и одна запись независимо от частоты запросов.
+
+Состояния корзин хранятся в хранилище, общем для всех процессов:
+FileBucketStore - отображаемый в память файл для процессов одного сервера,
+DatabaseBucketStore - таблица базы данных для нескольких серверов.
+Хранилище создается методом from_settings из настройки THROTTLE.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+from rest_framework.throttling import (AnonRateThrottle, ScopedRateThrottle,
+                                       SimpleRateThrottle, UserRateThrottle)
+
+from .models import ThrottleBucket
+
+# Допуск на погрешность вычислений с плавающей точкой, в секундах
+TOLERANCE = 1e-6
+
+
+def consume_token(full_at, now, capacity, period):
+    """
+    Новый момент заполнения корзины после запроса и время ожидания:
+    (момент, 0) - запрос разрешен, (None, секунды) - запрос отклонен
+    """
+    interval = period / capacity
+    full_at = max(full_at, now) + interval
+    wait = full_at - period - now
+    if wait > TOLERANCE:
+        return None, wait
+    return full_at, 0.0
+
+
+class FileBucketStore:
+    """
+    Корзины в файле, общем для процессов одного сервера. Ключ хешируется
+    в одну из slots ячеек; ячейка блокируется на время проверки. При
+    совпадении ячеек разных ключей корзина сбрасывается, что только
+    ослабляет ограничение.
+    """
+    slot = struct.Struct('=Qd')
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.pid = None
+
+    @classmethod
+    def from_settings(cls, options):
+        return cls(options['FILE'], options['SLOTS'])
+
+    def _open(self):
+        if self.pid == os.getpid():
+            return
+        size = self.slots * self.slot.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self.map = mmap.mmap(fd, size)
+        self.fd = fd
+        self.pid = os.getpid()
+
+    def consume(self, key, capacity, period):
+        """Списание маркера: время ожидания в секундах, 0 - разрешено"""
+        digest = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little'
+        )
+        offset = digest % self.slots * self.slot.size
+        with self.lock:
+            self._open()
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.slot.size, offset)
+            try:
+                stored, full_at = self.slot.unpack_from(self.map, offset)
+                full_at, wait = consume_token(
+                    full_at if stored == digest else 0.0,
+                    time.time(), capacity, period
+                )
+                if full_at is not None:
+                    self.slot.pack_into(self.map, offset, digest, full_at)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slot.size, offset)
+        return wait
+
+
+class DatabaseBucketStore:
+    """
+    Корзины в таблице базы данных, общей для всех серверов. Маркер
+    списывается одним запросом INSERT ... ON CONFLICT DO UPDATE, условие
+    которого не изменяет строку, если корзина пуста. Полные корзины время
+    от времени удаляются.
+    """
+    cleanup_probability = 0.001
+
+    @classmethod
+    def from_settings(cls, options):
+        return cls()
+
+    def consume(self, key, capacity, period):
+        """Списание маркера: время ожидания в секундах, 0 - разрешено"""
+        quote_name = connection.ops.quote_name
+        table = quote_name(ThrottleBucket._meta.db_table)
+        key_column = quote_name('key')
+        interval = period / capacity
+        now = time.time()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({key_column}, full_at) '
+                f'VALUES (%s, %s) '
+                f'ON CONFLICT ({key_column}) DO UPDATE SET full_at = '
+                f'CASE WHEN {table}.full_at > %s THEN {table}.full_at '
+                f'ELSE %s END + %s '
+                f'WHERE {table}.full_at + %s - %s <= %s',
+                (key, now + interval, now, now, interval, interval, period,
+                 now + TOLERANCE)
+            )
+            if cursor.rowcount:
+                if random.random() < self.cleanup_probability:
+                    cursor.execute(
+                        f'DELETE FROM {table} WHERE full_at < %s', (now,)
+                    )
+                return 0.0
+            cursor.execute(
+                f'SELECT full_at FROM {table} WHERE {key_column} = %s',
+                (key,)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return 0.0
+        return max(row[0] + interval - period - now, 0.0)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Хранилище корзин, заданное настройкой THROTTLE"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = settings.THROTTLE
+                _store = import_string(options['STORE']).from_settings(
+                    options
+                )
+    return _store
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Ограничение частоты запросов с общим для процессов хранилищем
+    вместо истории запросов в кеше
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None or not settings.THROTTLE['ENABLED']:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.retry_after = get_store().consume(
+            self.key, self.num_requests, self.duration
+        )
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonBucketThrottle(TokenBucketThrottle, AnonRateThrottle):
+    """Ограничение для анонимных пользователей по адресу клиента"""
+
+
+class UserBucketThrottle(TokenBucketThrottle, UserRateThrottle):
+    """Ограничение для каждого пользователя"""
+
+
+class ScopedBucketThrottle(TokenBucketThrottle, ScopedRateThrottle):
+    """
+    Дополнительное ограничение отдельных действий. Область задается
+    словарем throttle_scopes представления по имени действия или, как в
+    ScopedRateThrottle, атрибутом throttle_scope.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = (
+            getattr(view, 'throttle_scopes', {}).get(
+                getattr(view, 'action', None)
+            )
+            or getattr(view, self.scope_attr, None)
+        )
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
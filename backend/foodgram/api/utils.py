@@ -1,7 +1,4 @@
 """Вспомогательные классы и функции"""
-from django.db.models import BooleanField, Exists, OuterRef, Value
-
-from users.models import Subscription
 
 
 class URLParameter():
@@ -16,18 +13,3 @@ class URLParameter():
             serializer_field.context.get('request')
             .parser_context.get('kwargs').get(self.field_name)
         )
-
-
-def is_subscribed_annotation(queryset, user):
-    """Добавление признака подписки пользователя на автора рецепта"""
-    if user.is_authenticated:
-        return queryset.annotate(
-            is_subscribed=Exists(
-                Subscription.objects.filter(
-                    subscriber=user,
-                    author=OuterRef('pk')
-                )
-            )
-        )
-    else:
-        return queryset.annotate(is_subscribed=Value(False, BooleanField()))
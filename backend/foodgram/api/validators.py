@@ -11,8 +11,10 @@ class NotEqualValidator:
         self.message = message or self.message
 
     def __call__(self, attrs):
+        # Objects and primary keys from URL parameters are compared by key
         unique_values = set(
-            value for field, value in attrs.items() if field in self.fields
+            str(getattr(value, 'pk', value))
+            for field, value in attrs.items() if field in self.fields
         )
         if len(unique_values) != len(self.fields):
             raise serializers.ValidationError(self.message)
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import (BooleanField, Count, Exists, OuterRef, Prefetch,
-                              Value)
-from django.http import FileResponse
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from djoser.views import UserViewSet
@@ -9,45 +10,134 @@ from rest_framework import decorators, exceptions, response, status, viewsets
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 
-from recipes.models import Ingredient, Recipe, Tag
-from recipes.services import get_shopping_list
+from recipes.feed import FEED_ORDERING, get_feed
+from recipes.ingredient_index import get_ingredient_index
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
+from recipes.services import (add_to_recipe_list, get_shopping_list,
+                              lock_user, remove_from_recipe_list)
 from users.models import Subscription
-from .filters import (FavoritesFilter, IngredientFilter, RecipeFilter,
-                      ShoppingCartFilter)
+from users.services import add_subscriptions, remove_subscriptions
+from .caching import CatalogCacheMixin
+from .context import refresh_user_context
+from .filters import RecipeFilter
 from .pagination import RecipePagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FavoritesSerializer, IngredientSerializer,
+from .renderers import (CSVShoppingListRenderer, ShoppingListNegotiation,
+                        TxtShoppingListRenderer)
+from .serializers import (BatchSerializer, FavoritesSerializer,
+                          IngredientSerializer,
                           RecipeSerializer, RecipeShortSerializer,
                           ShoppingCartSerialzier, SubscriptionSerializer,
                           TagSerializer, UserRecipeSerializer)
-from .services import render_txt
-from .utils import is_subscribed_annotation
 
 User = get_user_model()
 
+SHOPPING_LIST_FILENAME = 'my_shopping_list'
+SHOPPING_LIST_CHUNK_SIZE = 500
+SEARCH_QUERY_PARAM = 'q'
+# Результаты пакетных операций по идентификаторам
+ADDED, EXISTS, REMOVED, ABSENT = 'added', 'exists', 'removed', 'absent'
+NOT_FOUND, INVALID = 'not_found', 'invalid'
+# Попытки пакетной операции при одновременном изменении тех же записей
+BATCH_ATTEMPTS = 3
 
-class TagViewset(viewsets.ReadOnlyModelViewSet):
+
+def batch_operation(request, model, add, remove, invalid=()):
+    """
+    Пакетное добавление (POST) или удаление (DELETE) объектов model по
+    списку ids из тела запроса в одной транзакции функциями add и remove.
+    Если объект удален или запись добавлена другим запросом во время
+    транзакции, она повторяется. Возвращает результат для каждого
+    идентификатора.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    for attempt in range(BATCH_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                found = set(
+                    model.objects.filter(pk__in=ids)
+                    .values_list('pk', flat=True)
+                ) - set(invalid)
+                targets = [pk for pk in ids if pk in found]
+                if request.method == 'POST':
+                    changed = add(request.user, targets)
+                    done, unchanged = ADDED, EXISTS
+                else:
+                    changed = remove(request.user, targets)
+                    done, unchanged = REMOVED, ABSENT
+            break
+        except IntegrityError:
+            if attempt == BATCH_ATTEMPTS - 1:
+                raise
+    refresh_user_context(request)
+    changed = set(changed)
+    return response.Response({'results': [
+        {
+            'id': pk,
+            'status': (
+                INVALID if pk in invalid
+                else NOT_FOUND if pk not in found
+                else done if pk in changed
+                else unchanged
+            )
+        }
+        for pk in ids
+    ]})
+
+
+class TagViewset(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Справочник ингредиентов с поиском по началу названия (параметр name).
+    Ответы формируются из индекса в памяти процесса без обращения к базе
+    данных; количество найденных ингредиентов ограничивается параметром
+    limit или настройкой RECIPES['INGREDIENT_SEARCH_LIMIT'].
+    """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+
+    def get_search_limit(self):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return settings.RECIPES['INGREDIENT_SEARCH_LIMIT']
+        return max(limit, 1)
+
+    def list(self, request, *args, **kwargs):
+        index = get_ingredient_index()
+        name = request.query_params.get('name')
+        if name is None:
+            return response.Response(index.all())
+        return response.Response(index.search(name, self.get_search_limit()))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            ingredient = get_ingredient_index().get(int(kwargs['pk']))
+        except ValueError:
+            ingredient = None
+        if ingredient is None:
+            raise exceptions.NotFound()
+        return response.Response(ingredient)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Recipe.objects.all()
-        .prefetch_related('tags')
-        .prefetch_related(
-            'recipe_to_ingredients__ingredient__measurement_unit'
-        )
-    )
+    queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = RecipePagination
+    cursor_ordering = ('-edited', '-id')
+    throttle_scopes = {
+        'create': 'uploads',
+        'update': 'uploads',
+        'partial_update': 'uploads',
+        'download_shopping_cart': 'downloads',
+    }
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (
@@ -55,25 +145,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
 
     def get_queryset(self):
-
-        user = self.request.user
-        queryset = self.queryset.prefetch_related(Prefetch(
-            'author',
-            is_subscribed_annotation(User.objects.all(), user)
-        ))
-        if user.is_authenticated:
-            return queryset.annotate(
-                is_in_shopping_cart=Exists(
-                    ShoppingCartFilter(request=self.request).qs
-                ),
-                is_favorited=Exists(
-                    FavoritesFilter(request=self.request).qs
-                )
-            )
-        return queryset.annotate(
-            is_in_shopping_cart=Value(0, BooleanField()),
-            is_favorited=Value(0, BooleanField())
-        )
+        return self.queryset.select_related('author')
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -86,7 +158,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 context={'request': request}
             )
             list_serializer.is_valid(raise_exception=True)
-            list_serializer.save(user=request.user, recipe=recipe)
+            with transaction.atomic():
+                lock_user(request.user)
+                list_serializer.save(user=request.user, recipe=recipe)
+            refresh_user_context(request)
             recipe_serializer = RecipeShortSerializer(recipe)
             headers = self.get_success_headers(recipe_serializer.data)
             return response.Response(
@@ -95,10 +170,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 headers=headers
             )
         elif request.method == 'DELETE':
-            serializer_class.Meta.model.objects.filter(
-                user=request.user,
-                recipe=recipe
-            ).delete()
+            with transaction.atomic():
+                lock_user(request.user)
+                serializer_class.Meta.model.objects.filter(
+                    user=request.user,
+                    recipe=recipe
+                ).delete()
+            refresh_user_context(request)
             return response.Response(status=status.HTTP_204_NO_CONTENT)
         raise exceptions.MethodNotAllowed(request.method)
 
@@ -126,36 +204,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
             FavoritesSerializer
         )
 
+    @decorators.action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart'
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление и удаление нескольких рецептов в списке покупок"""
+        return self._recipe_list_batch(request, ShoppingCart)
+
+    @decorators.action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite'
+    )
+    def favorite_batch(self, request):
+        """Добавление и удаление нескольких рецептов в избранном"""
+        return self._recipe_list_batch(request, Favorite)
+
+    @staticmethod
+    def _recipe_list_batch(request, model):
+        return batch_operation(
+            request, Recipe,
+            lambda user, ids: add_to_recipe_list(model, user, ids),
+            lambda user, ids: remove_from_recipe_list(model, user, ids)
+        )
+
     @decorators.action(
         detail=False,
         methods=['GET'],
-        permission_classes=(IsAuthenticated,)
+        cursor_ordering=('-search_rank', '-id')
+    )
+    def search(self, request):
+        """
+        Полнотекстовый поиск рецептов по словам параметра q с учетом
+        фильтров, в порядке убывания релевантности
+        """
+        text = request.query_params.get(SEARCH_QUERY_PARAM, '').strip()
+        if not text:
+            raise exceptions.ValidationError(
+                {SEARCH_QUERY_PARAM: 'Обязательный параметр.'}
+            )
+        queryset = search_recipes(
+            self.filter_queryset(self.get_queryset()), text
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @decorators.action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        cursor_ordering=FEED_ORDERING
+    )
+    def feed(self, request):
+        """
+        Лента подписок: рецепты авторов, на которых подписан пользователь,
+        с учетом фильтров, от новых к старым
+        """
+        queryset = self.filter_queryset(
+            get_feed(request.user, self.get_queryset())
+        ).order_by(*FEED_ORDERING)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @decorators.action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(TxtShoppingListRenderer, CSVShoppingListRenderer),
+        content_negotiation_class=ShoppingListNegotiation
     )
     def download_shopping_cart(self, request):
-        shopping_list = get_shopping_list(request.user)
-        return FileResponse(render_txt(
-            shopping_list, 'my_shopping_list'),
-            as_attachment=True,
+        """Выгрузка списка покупок в формате txt или csv"""
+        renderer = request.accepted_renderer
+        shopping_list = get_shopping_list(request.user).iterator(
+            chunk_size=SHOPPING_LIST_CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_list),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOPPING_LIST_FILENAME}.'
+            f'{renderer.format}"'
+        )
+        return response
 
 
 class WebUserViewSet(UserViewSet):
 
-    def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return super().get_queryset().annotate(
-                is_subscribed=Exists(
-                    Subscription.objects.filter(
-                        subscriber=self.request.user,
-                        author=OuterRef('pk')
-                    )
-                )
-            )
-        else:
-            return super().get_queryset().annotate(
-                is_subscribed=Value(False, BooleanField())
-            )
-
     @decorators.action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -169,7 +311,10 @@ class WebUserViewSet(UserViewSet):
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save(subscriber=request.user, author=user)
+            with transaction.atomic():
+                lock_user(request.user)
+                serializer.save(subscriber=request.user, author=user)
+            refresh_user_context(request)
             user_serializer = UserRecipeSerializer(
                 user, context={'request': request}
             )
@@ -177,24 +322,39 @@ class WebUserViewSet(UserViewSet):
                 user_serializer.data, status=status.HTTP_201_CREATED
             )
         if request.method == 'DELETE':
-            Subscription.objects.filter(
-                subscriber=request.user, author=user
-            ).delete()
+            with transaction.atomic():
+                lock_user(request.user)
+                Subscription.objects.filter(
+                    subscriber=request.user, author=user
+                ).delete()
+            refresh_user_context(request)
             return response.Response(status=status.HTTP_204_NO_CONTENT)
         raise exceptions.MethodNotAllowed(request.method)
 
+    @decorators.action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=(IsAuthenticated,),
+        url_path='subscribe'
+    )
+    def subscribe_batch(self, request):
+        """Подписка на нескольких авторов и отписка от них"""
+        return batch_operation(
+            request, User, add_subscriptions, remove_subscriptions,
+            invalid=(request.user.pk,)
+        )
+
 
 class SubscriptionsViewSet(viewsets.mixins.ListModelMixin,
                            viewsets.GenericViewSet):
     serializer_class = UserRecipeSerializer
     pagination_class = RecipePagination
     permission_classes = (IsAuthenticated,)
+    cursor_ordering = ('-subscription_id',)
 
     def get_queryset(self):
         return (
-            User.objects.filter(
-                subscribers__subscriber=self.request.user
-            )
-            .annotate(is_subscribed=Value(True, BooleanField()))
-            .annotate(recipes_count=Count('recipes'))
+            User.objects.filter(subscribers__subscriber=self.request.user)
+            .annotate(subscription_id=F('subscribers__id'))
+            .order_by('-subscription_id')
         )
@@ -0,0 +1,20 @@
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+wsgi_application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+from django.db import connections  # noqa: E402
+
+from foodgram.asgi_handler import ASGIHandler  # noqa: E402
+from recipes.ingredient_index import warm_up  # noqa: E402
+
+application = ASGIHandler(wsgi_application, settings.ASGI['THREADS'])
+
+warm_up()
+# Requests are handled by pool threads, so the main thread does not keep
+# its connection open
+connections.close_all()
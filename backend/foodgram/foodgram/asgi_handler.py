@@ -0,0 +1,157 @@
+"""Обработчик ASGI для WSGI-приложения Django
+
+Django 2.2 не поддерживает ASGI, поэтому запросы обрабатываются обычным
+обработчиком WSGI в ограниченном пуле потоков, а чтение тела запроса и
+передача ответа выполняются асинхронно в цикле событий. Поток пула занят
+только на время работы Django: ответ, в том числе потоковый, полностью
+формируется в потоке во временный файл, а медленная загрузка изображения
+или медленное чтение выгрузки клиентом потоков не занимают. Все работы,
+нагружающие процессор (декодирование изображений, формирование выгрузок),
+выполняются в потоках пула, поэтому их число не превышает его размера.
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+CHUNK_SIZE = 64 * 1024
+# Объем тела запроса или ответа, до которого файл хранится в памяти
+SPOOL_SIZE = 1024 * 1024
+
+
+def build_environ(scope, body):
+    """Окружение WSGI для запроса ASGI"""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('server'):
+        environ['SERVER_NAME'] = scope['server'][0]
+        environ['SERVER_PORT'] = str(scope['server'][1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    if 'CONTENT_LENGTH' not in environ:
+        # A chunked request has no length, but its body is already read
+        body.seek(0, os.SEEK_END)
+        environ['CONTENT_LENGTH'] = str(body.tell())
+        body.seek(0)
+    return environ
+
+
+class ASGIHandler:
+    """Приложение ASGI, выполняющее приложение WSGI в пуле потоков"""
+
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            threads, thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип запроса {scope["type"]}')
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        status, headers, content = await asyncio.get_running_loop(
+        ).run_in_executor(self.executor, self.run, scope, body)
+        with content:
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': headers,
+            })
+            while True:
+                chunk = content.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body'})
+
+    @staticmethod
+    async def read_body(receive):
+        """Тело запроса или None, если клиент отключился"""
+        body = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    def run(self, scope, body):
+        """Обработка запроса приложением WSGI в потоке пула"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        content = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        with body:
+            result = self.wsgi_application(
+                build_environ(scope, body), start_response
+            )
+            try:
+                for chunk in result:
+                    content.write(chunk)
+            except BaseException:
+                content.close()
+                raise
+            finally:
+                # Django closes database connections of the thread here
+                if hasattr(result, 'close'):
+                    result.close()
+        content.seek(0)
+        return response['status'], response['headers'], content
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(
+                    None, partial(self.executor.shutdown, wait=True)
+                )
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
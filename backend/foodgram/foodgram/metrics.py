@@ -0,0 +1,243 @@
+"""Метрики обработки запросов в формате Prometheus
+
+Промежуточный слой MetricsMiddleware измеряет длительность обработки
+запроса, а обертка выполнения запросов к базе данных - количество и время
+SQL-запросов. Значения накапливаются в памяти процесса по имени
+представления (например recipe-list или user-subscribe) и методу HTTP,
+а текст для Prometheus формируется только при обращении к metrics_view.
+Другие модули добавляют свои метрики функциями-сборщиками, которые
+регистрируются через registry.add_collector.
+
+Значения относятся к одному процессу: при нескольких процессах сервера
+каждый запрос метрик обслуживает один из них, и Prometheus видит счетчики
+только этого процесса. Для суммарных значений каждый процесс нужно
+опрашивать отдельно (например, по своему порту).
+
+При заданном METRICS['TOKEN'] метрики отдаются только запросам с
+заголовком Authorization: Bearer <токен>. Иначе доступ разрешен адресам из
+METRICS['ALLOWED_IPS']; за прокси из METRICS['TRUSTED_PROXIES'] адрес
+клиента берется из заголовка METRICS['CLIENT_IP_HEADER'], так как
+REMOTE_ADDR всегда содержит адрес прокси.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+UNRESOLVED_VIEW = 'unresolved'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class QueryTimer:
+    """Обертка выполнения SQL-запросов, считающая их количество и время"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class ViewStats:
+    """Накопленные значения для пары представление - метод"""
+
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.query_duration = 0.0
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.views = {}
+        self.collectors = []
+
+    def add_collector(self, collect):
+        """
+        Регистрация функции, возвращающей метрики в виде кортежей
+        (имя, тип, описание, [(метки, значение), ...])
+        """
+        self.collectors.append(collect)
+
+    def observe(self, view, method, status, duration, timer):
+        with self.lock:
+            stats = self.views.get((view, method))
+            if stats is None:
+                stats = self.views[(view, method)] = ViewStats(self.buckets)
+            stats.bucket_counts[bisect_left(self.buckets, duration)] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += timer.count
+            stats.query_duration += timer.duration
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def render(self):
+        """Текст метрик в формате Prometheus"""
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        histogram, requests, queries, query_durations = [], [], [], []
+        with self.lock:
+            for (view, method), stats in sorted(self.views.items()):
+                labels = _labels(view=view, method=method)
+                cumulative = 0
+                for bound, count in zip(bounds, stats.bucket_counts):
+                    cumulative += count
+                    histogram.append(
+                        'foodgram_request_duration_seconds_bucket'
+                        f'{_labels(view=view, method=method, le=bound)} '
+                        f'{cumulative}'
+                    )
+                histogram.append(
+                    f'foodgram_request_duration_seconds_sum{labels} '
+                    f'{_number(stats.duration)}'
+                )
+                histogram.append(
+                    f'foodgram_request_duration_seconds_count{labels} '
+                    f'{stats.count}'
+                )
+                for status, count in sorted(stats.statuses.items()):
+                    requests.append(
+                        'foodgram_requests_total'
+                        f'{_labels(view=view, method=method, status=status)}'
+                        f' {count}'
+                    )
+                queries.append(
+                    f'foodgram_db_queries_total{labels} {stats.queries}'
+                )
+                query_durations.append(
+                    f'foodgram_db_duration_seconds_total{labels} '
+                    f'{_number(stats.query_duration)}'
+                )
+        lines = [
+            '# HELP foodgram_request_duration_seconds '
+            'Request processing time.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+            *histogram,
+            '# HELP foodgram_requests_total Processed requests.',
+            '# TYPE foodgram_requests_total counter',
+            *requests,
+            '# HELP foodgram_db_queries_total SQL queries executed.',
+            '# TYPE foodgram_db_queries_total counter',
+            *queries,
+            '# HELP foodgram_db_duration_seconds_total '
+            'Time spent executing SQL queries.',
+            '# TYPE foodgram_db_duration_seconds_total counter',
+            *query_durations,
+        ]
+        for collect in self.collectors:
+            for name, kind, description, samples in collect():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(
+                    f'{name}{_labels(**labels)} {_number(value)}'
+                    for labels, value in samples
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value))
+
+
+def _labels(**labels):
+    escaped = (
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')
+        )
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = MetricsRegistry(settings.METRICS['BUCKETS'])
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return UNRESOLVED_VIEW
+    return match.url_name
+
+
+class MetricsMiddleware:
+    """Измерение времени ответа и запросов к базе данных по представлениям"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with self.timing(timer):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, timer, start
+            )
+        else:
+            self.observe(request, response, timer, start)
+        return response
+
+    @staticmethod
+    def timing(timer):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        return stack
+
+    def stream(self, content, request, response, timer, start):
+        """Учет запросов, выполняемых при передаче потокового ответа"""
+        try:
+            with self.timing(timer):
+                yield from content
+        finally:
+            self.observe(request, response, timer, start)
+
+    @staticmethod
+    def observe(request, response, timer, start):
+        registry.observe(
+            _view_name(request), request.method, response.status_code,
+            time.perf_counter() - start, timer
+        )
+
+
+def client_address(request):
+    """Адрес клиента с учетом заголовка доверенного прокси"""
+    address = request.META.get('REMOTE_ADDR')
+    if address in settings.METRICS['TRUSTED_PROXIES']:
+        return request.META.get(settings.METRICS['CLIENT_IP_HEADER'])
+    return address
+
+
+def is_allowed(request):
+    token = settings.METRICS['TOKEN']
+    if token:
+        return hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(),
+            f'Bearer {token}'.encode()
+        )
+    return client_address(request) in settings.METRICS['ALLOWED_IPS']
+
+
+def metrics_view(request):
+    """Метрики для Prometheus, доступные только разрешенным клиентам"""
+    if not is_allowed(request):
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
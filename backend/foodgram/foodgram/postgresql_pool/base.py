@@ -0,0 +1,157 @@
+"""Бэкенд PostgreSQL с пулом соединений
+
+Соединение, которое Django закрывает в конце запроса, возвращается в пул
+процесса и выдается следующему запросу без повторного подключения.
+Параметры пула задаются в DATABASES[...]['POOL']: MAX_SIZE, TIMEOUT,
+MAX_IDLE, MAX_LIFETIME и CHECK_INTERVAL (смотри ConnectionPool). Метрики
+пулов добавляются к метрикам Prometheus приложения.
+"""
+import threading
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from foodgram.metrics import registry
+from .pool import ConnectionPool, PoolTimeout
+
+Database = base.Database
+
+POOL_OPTIONS = {
+    'MAX_SIZE': 'max_size',
+    'TIMEOUT': 'timeout',
+    'MAX_IDLE': 'max_idle',
+    'MAX_LIFETIME': 'max_lifetime',
+    'CHECK_INTERVAL': 'check_interval',
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def check_connection(connection):
+    """Проверка соединения запросом к серверу"""
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if connection.status != extensions.STATUS_READY:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def reset_connection(connection):
+    """Откат незавершенной транзакции перед возвратом соединения в пул"""
+    if connection.closed:
+        return False
+    try:
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def close_connection(connection):
+    connection.close()
+
+
+def get_pool(alias, settings_dict):
+    """Пул соединений для псевдонима базы данных и параметров подключения"""
+    key = (alias, settings_dict['HOST'], settings_dict['PORT'],
+           settings_dict['NAME'], settings_dict['USER'])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = settings_dict.get('POOL', {})
+            pool = _pools[key] = ConnectionPool(
+                check_connection, reset_connection, close_connection,
+                **{
+                    argument: options[option]
+                    for option, argument in POOL_OPTIONS.items()
+                    if option in options
+                }
+            )
+        return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, self.settings_dict)
+        try:
+            connection = self.pool.get(
+                partial(super().get_new_connection, conn_params)
+            )
+        except PoolTimeout as error:
+            raise Database.OperationalError(str(error)) from error
+        # A reused connection was opened by another wrapper
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps a connection closed inside an atomic block
+                # until the block exits, so it must not be handed out again
+                self.pool.discard(self.connection)
+            else:
+                self.pool.put(self.connection)
+
+
+def collect_metrics():
+    """Метрики пулов соединений процесса"""
+    with _pools_lock:
+        pools = [(key[0], pool.stats()) for key, pool in _pools.items()]
+    gauges = (
+        ('foodgram_db_pool_connections', 'gauge',
+         'Open pooled database connections.', 'size'),
+        ('foodgram_db_pool_idle_connections', 'gauge',
+         'Pooled connections available for checkout.', 'idle'),
+        ('foodgram_db_pool_busy_connections', 'gauge',
+         'Pooled connections checked out by requests.', 'busy'),
+        ('foodgram_db_pool_max_connections', 'gauge',
+         'Pool size limit.', 'max_size'),
+        ('foodgram_db_pool_waiting', 'gauge',
+         'Requests waiting for a free connection.', 'waiting'),
+        ('foodgram_db_pool_waits_total', 'counter',
+         'Checkouts that had to wait for a free connection.', 'waits'),
+        ('foodgram_db_pool_wait_seconds_total', 'counter',
+         'Time spent waiting for a free connection.', 'wait_duration'),
+        ('foodgram_db_pool_timeouts_total', 'counter',
+         'Checkouts that failed after waiting for the pool timeout.',
+         'timeouts'),
+        ('foodgram_db_pool_checkouts_total', 'counter',
+         'Connections handed out by the pool.', 'checkouts'),
+        ('foodgram_db_pool_checkout_seconds_total', 'counter',
+         'Time spent checking out connections, including connects.',
+         'checkout_duration'),
+        ('foodgram_db_pool_connects_total', 'counter',
+         'New database connections opened by the pool.', 'connects'),
+        ('foodgram_db_pool_recycled_total', 'counter',
+         'Connections closed for exceeding idle time or lifetime.',
+         'recycled'),
+        ('foodgram_db_pool_failed_checks_total', 'counter',
+         'Idle connections that failed the health check on checkout.',
+         'failed_checks'),
+    )
+    return [
+        (name, kind, description, [
+            ({'database': alias}, stats[field]) for alias, stats in pools
+        ])
+        for name, kind, description, field in gauges
+    ]
+
+
+registry.add_collector(collect_metrics)
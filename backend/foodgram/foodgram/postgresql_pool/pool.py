@@ -0,0 +1,203 @@
+"""Пул соединений с базой данных
+
+Пул хранит открытые соединения процесса и выдает их вместо создания новых.
+Количество открытых соединений ограничено max_size; если все они заняты,
+запрос соединения ждет не дольше timeout секунд. Соединение, простоявшее
+без дела дольше check_interval, перед выдачей проверяется, а простоявшие
+дольше max_idle и открытые дольше max_lifetime закрываются. При возврате
+в пул незавершенная транзакция откатывается. После fork дочерний процесс
+не использует соединения родителя и открывает собственные.
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Все соединения пула заняты дольше допустимого времени ожидания"""
+
+
+class ConnectionPool:
+    """
+    Пул соединений. Функции check, reset и close проверяют, готовят
+    к повторному использованию и закрывают соединение; check и reset
+    возвращают False для непригодного соединения.
+    """
+
+    def __init__(self, check, reset, close, max_size=10, timeout=10.0,
+                 max_idle=300.0, max_lifetime=3600.0, check_interval=5.0):
+        self.check = check
+        self.reset = reset
+        self.close = close
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.condition = threading.Condition()
+        self.pid = os.getpid()
+        # Свободные соединения с моментом возврата, последнее - самое новое
+        self.idle = []
+        # Момент открытия каждого соединения пула, свободного или выданного
+        self.opened = {}
+        self.opening = 0
+        self.waiting = 0
+        self.waits = 0
+        self.wait_duration = 0.0
+        self.timeouts = 0
+        self.checkouts = 0
+        self.checkout_duration = 0.0
+        self.connects = 0
+        self.recycled = 0
+        self.failed_checks = 0
+
+    @property
+    def size(self):
+        return len(self.opened) + self.opening
+
+    def _after_fork(self):
+        """Забыть соединения родительского процесса, не закрывая их"""
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.idle = []
+            self.opened = {}
+            self.opening = 0
+            self.waiting = 0
+
+    def _expired(self, connection, now):
+        return now - self.opened[connection] > self.max_lifetime
+
+    def _take_stale(self, now):
+        """Изъятие соединений, простоявших или открытых слишком долго"""
+        stale = [
+            connection for connection, returned in self.idle
+            if now - returned > self.max_idle or self._expired(connection, now)
+        ]
+        if stale:
+            self.idle = [
+                (connection, returned) for connection, returned in self.idle
+                if connection not in stale
+            ]
+            for connection in stale:
+                del self.opened[connection]
+            self.recycled += len(stale)
+            self.condition.notify(len(stale))
+        return stale
+
+    def _close_all(self, connections):
+        for connection in connections:
+            try:
+                self.close(connection)
+            except Exception:
+                pass
+
+    def _acquire(self, deadline):
+        """
+        Свободное соединение с моментом его возврата в пул или (None, None),
+        если вызывающий должен открыть новое соединение
+        """
+        waited = False
+        stale = []
+        try:
+            with self.condition:
+                self._after_fork()
+                while True:
+                    now = time.monotonic()
+                    stale += self._take_stale(now)
+                    # A new request does not overtake requests already
+                    # waiting for a connection
+                    if self.idle and (waited or not self.waiting):
+                        if len(self.idle) > 1 and self.waiting:
+                            self.condition.notify()
+                        return self.idle.pop()
+                    if self.size < self.max_size:
+                        self.opening += 1
+                        return None, None
+                    if now >= deadline:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f'все {self.max_size} соединений пула заняты'
+                        )
+                    if not waited:
+                        waited = True
+                        self.waits += 1
+                    self.waiting += 1
+                    try:
+                        self.condition.wait(deadline - now)
+                    finally:
+                        self.waiting -= 1
+                        self.wait_duration += time.monotonic() - now
+        finally:
+            self._close_all(stale)
+
+    def discard(self, connection, counter=None):
+        """Закрытие соединения с освобождением места в пуле"""
+        with self.condition:
+            if counter is not None:
+                setattr(self, counter, getattr(self, counter) + 1)
+            if self.opened.pop(connection, None) is not None:
+                self.condition.notify()
+        self._close_all([connection])
+
+    def get(self, connect):
+        """Соединение из пула или открытое функцией connect"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            connection, returned = self._acquire(deadline)
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    with self.condition:
+                        self.opening -= 1
+                        self.condition.notify()
+                    raise
+                with self.condition:
+                    self.opening -= 1
+                    self.opened[connection] = time.monotonic()
+                    self.connects += 1
+                break
+            if (time.monotonic() - returned < self.check_interval
+                    or self.check(connection)):
+                break
+            self.discard(connection, 'failed_checks')
+        with self.condition:
+            self.checkouts += 1
+            self.checkout_duration += time.monotonic() - started
+        return connection
+
+    def put(self, connection):
+        """Возврат соединения в пул"""
+        with self.condition:
+            if self.pid != os.getpid() or connection not in self.opened:
+                return
+            expired = self._expired(connection, time.monotonic())
+        if expired:
+            self.discard(connection, 'recycled')
+            return
+        if not self.reset(connection):
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def stats(self):
+        """Текущие значения пула для метрик"""
+        with self.condition:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'busy': self.size - len(self.idle),
+                'max_size': self.max_size,
+                'waiting': self.waiting,
+                'waits': self.waits,
+                'wait_duration': self.wait_duration,
+                'timeouts': self.timeouts,
+                'checkouts': self.checkouts,
+                'checkout_duration': self.checkout_duration,
+                'connects': self.connects,
+                'recycled': self.recycled,
+                'failed_checks': self.failed_checks,
+            }
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -23,10 +24,11 @@ INSTALLED_APPS = [
     'djoser',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
-    'api'
+    'api.apps.ApiConfig'
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,14 +58,36 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASGI = {
+    # Threads running Django in each ASGI worker process
+    'THREADS': int(os.getenv('ASGI_THREADS', 8)),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.sqlite3'),
         'NAME': os.getenv('POSTGRES_DB', os.path.join(BASE_DIR, 'db.sqlite3')),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-        'HOST': 'db',
-        'PORT': '5432'
+        'HOST': os.getenv('DB_HOST', 'db'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 0)),
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'MAX_IDLE': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+            'MAX_LIFETIME': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+            'CHECK_INTERVAL': float(os.getenv('DB_POOL_CHECK_INTERVAL', 5)),
+        },
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -104,18 +128,53 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'api.throttling.AnonBucketThrottle',
+        'api.throttling.UserBucketThrottle',
+        'api.throttling.ScopedBucketThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '1000/hour',
         'user': '10000/hour',
+        'uploads': '100/hour',
+        'downloads': '30/hour',
     }
 }
 
+AUTH_CACHE = {
+    'SIZE': 10000,
+    'TIMEOUT': int(os.getenv('AUTH_CACHE_TIMEOUT', 10)),
+    # The shared tier makes sense only with a cache shared between processes
+    'SHARED_TIMEOUT': int(os.getenv('AUTH_SHARED_CACHE_TIMEOUT', 0)),
+}
+
+THROTTLE = {
+    # Read on every request, unlike DEFAULT_THROTTLE_CLASSES
+    'ENABLED': True,
+    # api.throttling.DatabaseBucketStore shares limits between hosts
+    'STORE': os.getenv('THROTTLE_STORE', 'api.throttling.FileBucketStore'),
+    'FILE': os.getenv(
+        'THROTTLE_FILE',
+        os.path.join(tempfile.gettempdir(), 'foodgram-throttle')
+    ),
+    'SLOTS': 2 ** 20,
+}
+
+METRICS = {
+    'ALLOWED_IPS': os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(','),
+    # Proxies whose CLIENT_IP_HEADER replaces REMOTE_ADDR for the check above
+    'TRUSTED_PROXIES': [
+        address for address
+        in os.getenv('METRICS_TRUSTED_PROXIES', '').split(',') if address
+    ],
+    'CLIENT_IP_HEADER': 'HTTP_X_REAL_IP',
+    # When set, only requests with "Authorization: Bearer <token>" are served
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -132,7 +191,25 @@ DJOSER = {
 
 RECIPES = {
     'TEXT_DISPLAY_LENGTH': 30,
-    'MAX_TAGS': 10
+    'MAX_TAGS': 10,
+    'USER_CONTEXT_TIMEOUT': int(os.getenv('USER_CONTEXT_TIMEOUT', 0)),
+    'RECIPE_FRAGMENT_TIMEOUT': int(os.getenv('RECIPE_FRAGMENT_TIMEOUT', 0)),
+    'INGREDIENT_SEARCH_LIMIT': 50,
+    # Largest number of ids in a batch favorite, cart or subscription request
+    'BATCH_SIZE': 100,
+    'CATALOG_CACHE_TIMEOUT': 60 * 60,
+    # Seconds a process trusts the catalog version it has read
+    'CATALOG_VERSION_TIMEOUT': int(os.getenv('CATALOG_VERSION_TIMEOUT', 2)),
+    'CATALOG_MAX_AGE': int(os.getenv('CATALOG_MAX_AGE', 0)),
+    'IMAGE_VARIANTS': {
+        'thumbnail': (480, 480),
+        'detail': (1200, 1200),
+    },
+    'IMAGE_QUALITY': 85,
+    'IMAGE_WORKERS': int(os.getenv('IMAGE_WORKERS', 2)),
+    # Authors with more subscribers are merged into feeds on read
+    'FEED_FANOUT_LIMIT': int(os.getenv('FEED_FANOUT_LIMIT', 1000)),
+    'FEED_BACKFILL': 100,
 }
 
 if DEBUG:
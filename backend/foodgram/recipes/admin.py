@@ -2,6 +2,7 @@ from django.conf import settings
 from django.contrib import admin
 
 from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag, Unit
+from .services import change_recipe_in_shopping_lists, get_recipe_amounts
 
 
 class IngredientInline(admin.TabularInline):
@@ -24,20 +25,27 @@ class IngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'cooking_time', 'tag_list')
+    list_display = (
+        'name', 'author', 'cooking_time', 'tag_list', 'favorites_count'
+    )
     fields = (
         'name', 'author', 'cooking_time', 'text',
-        'favorited_count', 'image', 'tags'
+        'favorites_count', 'in_cart_count', 'image', 'tags'
     )
-    readonly_fields = ('favorited_count',)
+    readonly_fields = ('favorites_count', 'in_cart_count')
     inlines = (IngredientInline,)
     search_fields = ('name', 'author__username', 'tags__name')
 
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related('tags')
 
-    def favorited_count(self, recipe):
-        return recipe.favorites.count()
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        old_amounts = get_recipe_amounts([recipe.pk])[recipe.pk]
+        super().save_related(request, form, formsets, change)
+        change_recipe_in_shopping_lists(
+            recipe, old_amounts, get_recipe_amounts([recipe.pk])[recipe.pk]
+        )
 
     def tag_list(self, recipe):
         return ', '.join(
@@ -45,7 +53,6 @@ class RecipeAdmin(admin.ModelAdmin):
             [:settings.RECIPES['MAX_TAGS']]
         )
 
-    favorited_count.short_description = 'в избранном'
     tag_list.short_description = 'теги'
 
 
@@ -0,0 +1,63 @@
+"""Версия справочников ингредиентов, единиц измерения и тегов
+
+Версия хранится в единственной строке таблицы CatalogVersion и
+увеличивается в транзакции, изменяющей справочники, поэтому ее видят все
+процессы и серверы независимо от настроенного кеша. По ней процессы
+определяют, что их локальные копии справочников устарели. Прочитанная
+версия используется процессом не дольше RECIPES['CATALOG_VERSION_TIMEOUT']
+секунд; собственные изменения процесс замечает сразу после фиксации.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import CatalogVersion
+
+CATALOG_VERSION_ID = 1
+
+# (version, monotonic time of the read)
+_version = (None, 0.0)
+
+
+def _read_version():
+    version = CatalogVersion.objects.filter(
+        pk=CATALOG_VERSION_ID
+    ).values_list('version', flat=True).first()
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_ID
+        )[0].version
+    return str(version)
+
+
+def _forget_version():
+    global _version
+    _version = (None, 0.0)
+
+
+def get_catalog_version():
+    """Текущая версия справочников"""
+    global _version
+    version, read_at = _version
+    now = time.monotonic()
+    if (
+        version is None
+        or now - read_at > settings.RECIPES['CATALOG_VERSION_TIMEOUT']
+    ):
+        version = _read_version()
+        _version = (version, now)
+    return version
+
+
+def bump_catalog_version():
+    """Смена версии справочников в текущей транзакции"""
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(
+        version=F('version') + 1
+    )
+    if not updated:
+        CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_ID, defaults={'version': 2}
+        )
+    transaction.on_commit(_forget_version)
@@ -0,0 +1,211 @@
+"""Ленты подписок пользователей
+
+Лента подписчика хранится в таблице FeedEntry: новый рецепт добавляется
+в ленты всех подписчиков автора при создании (fan-out on write), поэтому
+чтение ленты - это выборка по индексу одного пользователя. Для авторов,
+у которых подписчиков больше FEED_FANOUT_LIMIT, рецепты в ленты не
+записываются, а подмешиваются при чтении (fan-out on read). При подписке
+в ленту добавляются последние FEED_BACKFILL рецептов автора, при отписке
+его рецепты из ленты удаляются; пересоздание лент добавляет те же
+FEED_BACKFILL рецептов каждого автора.
+
+Когда после отписки число подписчиков автора опускается до
+FEED_FANOUT_LIMIT, его рецепты добавляются в ленты всех подписчиков
+в фоновом потоке после фиксации транзакции, а не в запросе отписки.
+Пока заполнение не закончено, рецепты автора с ровно FEED_FANOUT_LIMIT
+подписчиков подмешиваются при чтении.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from users.models import Subscription
+from .models import FeedEntry, Recipe
+from .services import LATEST_RECIPES_ORDERING, get_latest_recipes
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+FEED_ORDERING = ('-published', '-id')
+# Подписчиков, в ленты которых рецепты автора добавляются за один запрос
+BACKFILL_CHUNK_SIZE = 100
+# Авторов, последние рецепты которых выбираются за один запрос
+REBUILD_CHUNK_SIZE = 100
+
+_executor = None
+
+
+def _fanout_limit():
+    return settings.RECIPES['FEED_FANOUT_LIMIT']
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='feed-backfill'
+        )
+    return _executor
+
+
+def _add_recipes(recipes, subscriber_ids):
+    """Добавление рецептов [(id, момент публикации)] в ленты подписчиков"""
+    subscriber_ids = list(subscriber_ids)
+    for start in range(0, len(subscriber_ids), BACKFILL_CHUNK_SIZE):
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(
+                    subscriber_id=subscriber_id, recipe_id=recipe_id,
+                    published=published
+                )
+                for subscriber_id in
+                subscriber_ids[start:start + BACKFILL_CHUNK_SIZE]
+                for recipe_id, published in recipes
+            ],
+            ignore_conflicts=True
+        )
+
+
+def add_author_recipes(author_id, subscriber_ids):
+    """Добавление последних рецептов автора в ленты подписчиков"""
+    recipes = list(
+        Recipe.objects.filter(author_id=author_id)
+        .order_by(*LATEST_RECIPES_ORDERING)
+        .values_list('pk', 'edited')[:settings.RECIPES['FEED_BACKFILL']]
+    )
+    if recipes:
+        _add_recipes(recipes, subscriber_ids)
+
+
+def fan_out_recipe(recipe):
+    """Добавление нового рецепта в ленты подписчиков автора"""
+    subscriber_ids = list(
+        Subscription.objects.filter(
+            author_id=recipe.author_id,
+            author__subscribers_count__lte=_fanout_limit()
+        ).values_list('subscriber_id', flat=True)
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                subscriber_id=subscriber_id, recipe_id=recipe.pk,
+                published=recipe.edited
+            )
+            for subscriber_id in subscriber_ids
+        ],
+        ignore_conflicts=True
+    )
+
+
+def remove_recipe(recipe):
+    """Удаление рецепта из всех лент, например при смене автора"""
+    FeedEntry.objects.filter(recipe_id=recipe.pk).delete()
+
+
+def subscriptions_added(subscriber_id, author_ids):
+    """Добавление рецептов авторов в ленту нового подписчика"""
+    for author_id in User.objects.filter(
+        pk__in=author_ids, subscribers_count__lte=_fanout_limit()
+    ).values_list('pk', flat=True):
+        add_author_recipes(author_id, [subscriber_id])
+
+
+def backfill_authors(author_ids):
+    """
+    Добавление рецептов авторов в ленты всех их подписчиков, если число
+    подписчиков не превышает FEED_FANOUT_LIMIT. Выполняется в фоновом
+    потоке.
+    """
+    try:
+        for author_id in User.objects.filter(
+            pk__in=author_ids, subscribers_count__lte=_fanout_limit()
+        ).values_list('pk', flat=True):
+            add_author_recipes(
+                author_id,
+                Subscription.objects.filter(author_id=author_id)
+                .values_list('subscriber_id', flat=True)
+            )
+    except Exception:
+        logger.exception(
+            'Не удалось заполнить ленты подписчиков авторов %s', author_ids
+        )
+    finally:
+        connection.close()
+
+
+def subscriptions_removed(subscriber_id, author_ids):
+    """
+    Удаление рецептов авторов из ленты бывшего подписчика. Если число
+    подписчиков автора опустилось до FEED_FANOUT_LIMIT, его рецепты
+    добавляются в ленты подписчиков в фоновом потоке.
+    """
+    FeedEntry.objects.filter(
+        subscriber_id=subscriber_id, recipe__author_id__in=author_ids
+    ).delete()
+    returned = list(User.objects.filter(
+        pk__in=author_ids, subscribers_count=_fanout_limit()
+    ).values_list('pk', flat=True))
+    if returned:
+        transaction.on_commit(
+            lambda: get_executor().submit(backfill_authors, returned)
+        )
+
+
+def rebuild_feeds():
+    """
+    Пересоздание лент всех пользователей: в ленты подписчиков авторов,
+    у которых подписчиков не больше FEED_FANOUT_LIMIT, добавляются
+    последние FEED_BACKFILL рецептов автора, как при подписке.
+    Требует актуальных счетчиков подписчиков.
+    """
+    FeedEntry.objects.all().delete()
+    author_ids = list(
+        User.objects.filter(
+            subscribers_count__gt=0, subscribers_count__lte=_fanout_limit()
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+    for start in range(0, len(author_ids), REBUILD_CHUNK_SIZE):
+        chunk = author_ids[start:start + REBUILD_CHUNK_SIZE]
+        latest = get_latest_recipes(
+            chunk, settings.RECIPES['FEED_BACKFILL'], ('edited',)
+        )
+        subscribers = defaultdict(list)
+        for author_id, subscriber_id in Subscription.objects.filter(
+            author_id__in=chunk
+        ).values_list('author_id', 'subscriber_id'):
+            subscribers[author_id].append(subscriber_id)
+        for author_id, recipes in latest.items():
+            if recipes:
+                _add_recipes(
+                    [(recipe.pk, recipe.edited) for recipe in recipes],
+                    subscribers[author_id]
+                )
+
+
+def get_feed(user, queryset=None):
+    """
+    Рецепты авторов, на которых подписан пользователь, с аннотацией
+    published для сортировки в порядке FEED_ORDERING
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    # Authors exactly at the limit may still be waiting for backfill_authors
+    pulled_authors = list(
+        Subscription.objects.filter(
+            subscriber=user, author__subscribers_count__gte=_fanout_limit()
+        ).values_list('author_id', flat=True)
+    )
+    if not pulled_authors:
+        return queryset.filter(feed_entries__subscriber=user).annotate(
+            published=F('feed_entries__published')
+        )
+    return queryset.filter(
+        Q(pk__in=FeedEntry.objects.filter(subscriber=user).values('recipe'))
+        | Q(author_id__in=pulled_authors)
+    ).annotate(published=F('edited'))
@@ -0,0 +1,17 @@
+"""Дополнительные поля моделей"""
+from django.db import models
+
+
+class BitMaskField(models.BigIntegerField):
+    """Набор флагов, хранимый битами целого числа"""
+
+
+@BitMaskField.register_lookup
+class HasAnyBits(models.Lookup):
+    """Наличие в маске хотя бы одного из заданных битов"""
+    lookup_name = 'hasanybits'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) != 0', lhs_params + rhs_params
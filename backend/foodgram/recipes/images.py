@@ -0,0 +1,131 @@
+"""Уменьшенные копии изображений рецептов
+
+После сохранения рецепта с новым изображением в пуле потоков создаются
+его копии для каждого размера из RECIPES['IMAGE_VARIANTS'] в форматах JPEG
+и WebP. Имена копий однозначно выводятся из имени исходного файла, а
+признак Recipe.images_ready показывает, что копии уже созданы. Копии
+замененного или удаленного изображения удаляются, если оно больше не
+используется другими рецептами.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+FORMATS = {'jpg': 'JPEG', 'webp': 'WEBP'}
+
+_executor = None
+
+
+def variant_name(image_name, variant, extension):
+    """Имя файла копии изображения"""
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, VARIANTS_DIR, f'{stem}_{variant}.{extension}'
+    )
+
+
+def variant_names(image_name):
+    """Имена всех копий изображения по ключам вида thumbnail, thumbnail_webp"""
+    names = {}
+    for variant in settings.RECIPES['IMAGE_VARIANTS']:
+        for extension in FORMATS:
+            key = variant if extension == 'jpg' else f'{variant}_{extension}'
+            names[key] = variant_name(image_name, variant, extension)
+    return names
+
+
+def _encode(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(
+        buffer, image_format, quality=settings.RECIPES['IMAGE_QUALITY']
+    )
+    return buffer.getvalue()
+
+
+def build_variants(image_name):
+    """Создание копий изображения во всех размерах и форматах"""
+    with default_storage.open(image_name) as file:
+        original = Image.open(file)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA')
+    sizes = settings.RECIPES['IMAGE_VARIANTS']
+    for variant, size in sizes.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        for extension, image_format in FORMATS.items():
+            name = variant_name(image_name, variant, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(
+                name, ContentFile(_encode(image, image_format))
+            )
+
+
+def process_recipe_image(recipe_id, image_name):
+    """Создание копий и отметка о готовности, если изображение не сменилось"""
+    try:
+        build_variants(image_name)
+        Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+            images_ready=True
+        )
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение %s рецепта %s',
+            image_name, recipe_id
+        )
+    finally:
+        connection.close()
+
+
+def delete_variants(image_name):
+    """Удаление копий изображения, не используемого рецептами"""
+    try:
+        if Recipe.objects.filter(image=image_name).exists():
+            return
+        for name in variant_names(image_name).values():
+            default_storage.delete(name)
+    except Exception:
+        logger.exception('Не удалось удалить копии изображения %s', image_name)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPES['IMAGE_WORKERS'],
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def schedule_recipe_image(recipe):
+    """Постановка обработки изображения в очередь после фиксации транзакции"""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: get_executor().submit(
+        process_recipe_image, recipe_id, image_name
+    ))
+
+
+def schedule_variants_removal(image_name):
+    """Удаление копий прежнего изображения после фиксации транзакции"""
+    transaction.on_commit(lambda: get_executor().submit(
+        delete_variants, image_name
+    ))
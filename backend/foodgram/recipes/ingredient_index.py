@@ -0,0 +1,86 @@
+"""Поиск ингредиентов по началу названия
+
+Каждый процесс держит в памяти отсортированный по названию в нижнем
+регистре список ингредиентов и ищет в нем двоичным поиском. Список
+строится при первом обращении и перестраивается, когда меняется версия
+справочников (см. recipes.catalog).
+"""
+import logging
+import threading
+from bisect import bisect_left
+from itertools import islice
+
+from django.db import DatabaseError
+
+from .catalog import get_catalog_version
+from .models import Ingredient
+
+logger = logging.getLogger(__name__)
+
+
+class IngredientIndex:
+    """Упорядоченный по названию справочник ингредиентов"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        entries = sorted(
+            (name.casefold(), pk, name, unit) for pk, name, unit in rows
+        )
+        self.keys = [key for key, *_ in entries]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in entries
+        ]
+        self.by_id = {item['id']: item for item in self.items}
+
+    @classmethod
+    def load(cls, version=None):
+        return cls(
+            Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit__notation'
+            ),
+            version
+        )
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix"""
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        stop = start
+        end = len(self.keys) if limit is None else min(
+            start + limit, len(self.keys)
+        )
+        while stop < end and self.keys[stop].startswith(prefix):
+            stop += 1
+        return self.items[start:stop]
+
+    def all(self, limit=None):
+        return list(islice(self.items, limit))
+
+    def get(self, pk):
+        return self.by_id.get(pk)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """Индекс ингредиентов, соответствующий текущей версии справочников"""
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = IngredientIndex.load(version)
+        return _index
+
+
+def warm_up():
+    """Построение индекса при запуске процесса"""
+    try:
+        get_ingredient_index()
+    except DatabaseError as error:
+        logger.warning('Индекс ингредиентов не построен: %s', error)
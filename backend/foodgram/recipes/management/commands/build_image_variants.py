@@ -0,0 +1,40 @@
+"""Модуль создания уменьшенных копий изображений рецептов
+
+Обрабатывает рецепты, для которых копии еще не созданы, например
+загруженные до появления обработки изображений. С ключом --all копии
+создаются заново для всех рецептов.
+"""
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Builds resized variants of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild variants for every recipe'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(images_ready=False)
+        processed = failed = 0
+        for recipe_id, image_name in recipes.values_list('pk', 'image'):
+            try:
+                build_variants(image_name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{image_name}: {error}')
+                continue
+            Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+                images_ready=True
+            )
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибками: {failed}'
+        ))
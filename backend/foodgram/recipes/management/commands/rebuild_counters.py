@@ -0,0 +1,20 @@
+"""Модуль пересчета счетчиков
+
+Счетчики избранного и списков покупок у рецептов, количества рецептов
+и подписчиков у пользователей поддерживаются при каждой записи. Команда
+пересчитывает их по исходным таблицам, если значения разошлись, например
+после массовой загрузки данных.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.services import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds denormalized recipe and user counters'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
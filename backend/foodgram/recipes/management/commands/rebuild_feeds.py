@@ -0,0 +1,20 @@
+"""Модуль пересоздания лент подписок
+
+Ленты подписок пользователей пополняются при публикации рецептов и при
+подписке на автора. Команда заполняет их заново по подпискам и последним
+FEED_BACKFILL рецептам авторов, как при подписке, например после массовой
+загрузки данных без сигналов.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds subscription feeds from subscriptions and recipes'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rebuild_feeds()
+        self.stdout.write(self.style.SUCCESS('Ленты подписок пересчитаны'))
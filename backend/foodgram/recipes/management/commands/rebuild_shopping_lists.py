@@ -0,0 +1,19 @@
+"""Модуль пересоздания списков покупок
+
+Списки покупок пользователей хранятся в виде сумм по ингредиентам и
+изменяются при добавлении и удалении рецептов из корзины и при изменении
+состава рецептов. Команда пересчитывает их заново по корзинам.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.services import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds aggregated shopping lists from shopping carts'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rebuild_shopping_lists()
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны'))
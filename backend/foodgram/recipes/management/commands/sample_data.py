@@ -10,81 +10,200 @@
 словарь, в котором сопоставлено имя поля модели и имя поля в модели внешнего
 ключа.
 Словарь MODELS содержит в качестве ключей загружаемые модели, а в качестве
-занчений кортеж из имени файла .csv без расширения и словаря внешних ключей
-(смотри выше).
+занчений кортеж из имени файла .csv без расширения, словаря внешних ключей
+(смотри выше) и полей, однозначно определяющих запись.
 
+Строки файла читаются потоком и записываются пакетами через bulk_create,
+а в PostgreSQL - командой COPY. Для COPY непустые значения записываются
+в кавычках, а None - маркером NULL, поэтому пустые строки загружаются как
+пустые строки, как и через bulk_create. Значения внешних ключей сопоставляются
+с id по словарю, который загружается из таблицы внешнего ключа один раз
+и пополняется при создании недостающих записей. С ключом --upsert записи,
+уже имеющиеся в базе данных, обновляются, а не добавляются повторно.
 """
 import csv
+import io
 import os
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import Model
 
+from recipes.catalog import bump_catalog_version
 from recipes.models import Ingredient, Tag
+from recipes.services import assign_tag_bits
 
 CSV_DIR = os.path.join(settings.BASE_DIR, 'data/')
+BATCH_SIZE = 1000
+COPY_NULL = r'\N'
+
+
+def copy_value(value):
+    """Значение поля строки CSV для COPY: NULL без кавычек, иначе в кавычках"""
+    if value is None:
+        return COPY_NULL
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+class RelatedKeys:
+    """Соответствие значений поля модели внешнего ключа и id записей"""
+
+    def __init__(self, model: Model, field_name: str):
+        self.model = model
+        self.field_name = field_name
+        self.pks = dict(model.objects.values_list(field_name, 'pk'))
+
+    def __getitem__(self, value):
+        pk = self.pks.get(value)
+        if pk is None:
+            pk = self.model.objects.create(**{self.field_name: value}).pk
+            self.pks[value] = pk
+        return pk
 
 
 class Command(BaseCommand):
-    help = f'Loads sample data from CSV files in "{CSV_DIR}"'
+    help = (
+        f'Loads sample data from CSV files in "{CSV_DIR}". On PostgreSQL '
+        'new rows are written with COPY; that path is not covered by the '
+        'automated tests, which run on SQLite'
+    )
 
-    def load_csv(self, model: Model, filename: str, related={}):
-        related_models = {
-            field_name: (
-                getattr(model, field_name).field.related_model,
-                related_field_name
-            )
-            for field_name, related_field_name in related.items()
-        }
-        with open(
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Update rows that already exist instead of adding them'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def read_rows(self, model: Model, filename: str, related: dict):
+        """Имена столбцов таблицы и поток значений строк файла"""
+        file = open(
             os.path.join(CSV_DIR, filename),
             mode='r', encoding='utf-8', newline=''
-        ) as file:
-            reader = csv.reader(file)
-            headers = next(reader)
-            for row in reader:
-                params = dict(zip(headers, row))
-                # Handle user model
-                if hasattr(model.objects, 'create_user'):
-                    model.objects.create_user(**params)
-                    continue
-                # Handle other types of models
-                instance = model()
-                # Parse every column one by one
-                for key, value in params.items():
-                    key_id = f'{key}_id'
-                    # The column is a foreign table reference
-                    if hasattr(instance, key_id):
-                        # There are directions to add data to the foreign table
-                        if key in related_models:
-                            related_model, related_field_name = (
-                                related_models[key]
-                            )
-                            related_object, _ = (
-                                related_model.objects
-                                .get_or_create(**{related_field_name: value})
-                            )
-                            setattr(instance, key, related_object)
-                        # Foreign table should be already filled,
-                        # just  add reference
-                        else:
-                            setattr(instance, key_id, value)
-                    # The column is an ordinary data column
-                    else:
-                        setattr(instance, key, value)
-                instance.save()
+        )
+        reader = csv.reader(file)
+        headers = next(reader)
+        converters = []
+        attnames = []
+        for header in headers:
+            field = model._meta.get_field(header)
+            attnames.append(field.attname)
+            if field.is_relation and header in related:
+                # The column holds a value of the foreign table field
+                converters.append(RelatedKeys(
+                    field.related_model, related[header]
+                ).__getitem__)
+            elif field.is_relation:
+                # The column already holds a foreign table reference
+                converters.append(field.target_field.to_python)
+            else:
+                converters.append(field.to_python)
+
+        def rows():
+            with file:
+                for row in reader:
+                    yield tuple(
+                        convert(value)
+                        for convert, value in zip(converters, row)
+                    )
+        return attnames, rows()
+
+    def copy_rows(self, model: Model, attnames, rows):
+        """Запись строк командой COPY PostgreSQL"""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(
+            quote_name(model._meta.get_field(attname).column)
+            for attname in attnames
+        )
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f'COPY {quote_name(model._meta.db_table)} ({columns}) '
+                f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer
+            )
+
+    def upsert_rows(self, model: Model, attnames, batch, existing, keys):
+        """Обновление имеющихся записей и создание новых"""
+        update_fields = [name for name in attnames if name not in keys]
+        created = []
+        changed = []
+        for values in batch:
+            row = dict(zip(attnames, values))
+            key = tuple(row[name] for name in keys)
+            instance = existing.get(key)
+            if instance is None:
+                instance = existing[key] = model(**row)
+                created.append(instance)
+            elif instance.pk is not None and any(
+                getattr(instance, name) != row[name] for name in update_fields
+            ):
+                for name in update_fields:
+                    setattr(instance, name, row[name])
+                changed.append(instance)
+        model.objects.bulk_create(created)
+        if update_fields:
+            model.objects.bulk_update(changed, update_fields)
+        return len(created), len(changed)
+
+    def load_csv(self, model: Model, filename: str, related={}, key=(),
+                 upsert=False, batch_size=BATCH_SIZE):
+        attnames, rows = self.read_rows(model, filename, related)
+        keys = [model._meta.get_field(name).attname for name in key]
+        existing = {}
+        if upsert:
+            existing = {
+                tuple(getattr(instance, name) for name in keys): instance
+                for instance in model.objects.all()
+            }
+        use_copy = connection.vendor == 'postgresql' and not upsert
+        created = updated = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            if upsert:
+                batch_created, batch_updated = self.upsert_rows(
+                    model, attnames, batch, existing, keys
+                )
+                created += batch_created
+                updated += batch_updated
+            elif use_copy:
+                self.copy_rows(model, attnames, batch)
+                created += len(batch)
+            else:
+                model.objects.bulk_create(
+                    model(**dict(zip(attnames, values))) for values in batch
+                )
+                created += len(batch)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: добавлено {created}, '
+            f'обновлено {updated}'
+        )
 
     MODELS = {
-        Ingredient: ('ingredients', {'measurement_unit': 'notation'}),
-        Tag: ('tags', {})
+        Ingredient: (
+            'ingredients', {'measurement_unit': 'notation'},
+            ('name', 'measurement_unit')
+        ),
+        Tag: ('tags', {}, ('slug',))
     }
 
     @transaction.atomic
     def handle(self, *args, **options):
         try:
-            for model, (filebase, related) in self.MODELS.items():
-                self.load_csv(model, f'{filebase}.csv', related)
+            for model, (filebase, related, key) in self.MODELS.items():
+                self.load_csv(
+                    model, f'{filebase}.csv', related, key,
+                    options['upsert'], options['batch_size']
+                )
+            assign_tag_bits()
         except Exception as error:
             raise CommandError(f'что-то пошло не так. {error}')
+        bump_catalog_version()
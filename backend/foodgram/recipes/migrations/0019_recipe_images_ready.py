@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_auto_20261018_2011'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='images_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='уменьшенные изображения готовы'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-edited', '-id'], name='recipe_edited_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-edited', '-id'], name='recipe_author_edited_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
 
+from users.models import CountersMixin
+from .fields import BitMaskField
 from .utils import cut_text_display
 
 User = get_user_model()
@@ -47,6 +49,9 @@ class Tag(models.Model):
         null=True
     )
     slug = models.SlugField('код', unique=True, null=True)
+    bit = models.PositiveSmallIntegerField(
+        'номер бита в маске тегов', unique=True, null=True, editable=False
+    )
 
     class Meta:
         verbose_name = 'тег'
@@ -56,7 +61,19 @@ class Tag(models.Model):
         return cut_text_display(self.name)
 
 
-class Recipe(models.Model):
+class CatalogVersion(models.Model):
+    """Версия справочников, общая для всех процессов"""
+    version = models.PositiveIntegerField('версия', default=1)
+
+    class Meta:
+        verbose_name = 'версия справочников'
+        verbose_name_plural = 'версии справочников'
+
+    def __str__(self) -> str:
+        return str(self.version)
+
+
+class Recipe(CountersMixin, models.Model):
     "Рецепт"
     name = models.CharField('название', max_length=200)
     text = models.TextField('описание')
@@ -79,12 +96,33 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(Tag, verbose_name='теги')
     created = models.DateTimeField(auto_now=True)
     edited = models.DateTimeField(auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'в избранном', default=0, editable=False
+    )
+    in_cart_count = models.PositiveIntegerField(
+        'в списках покупок', default=0, editable=False
+    )
+    images_ready = models.BooleanField(
+        'уменьшенные изображения готовы', default=False, editable=False
+    )
+    tags_mask = BitMaskField('маска тегов', default=0, editable=False)
+
+    counter_fields = ('favorites_count', 'in_cart_count')
+    # Reset by the recipe_saved signal, set by recipes.images
+    background_fields = ('images_ready',)
 
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ('-edited',)
+        indexes = [
+            models.Index(fields=['-edited', '-id'], name='recipe_edited_idx'),
+            models.Index(
+                fields=['author', '-edited', '-id'],
+                name='recipe_author_edited_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return cut_text_display(self.name)
@@ -174,3 +212,70 @@ class Favorite(RecipeList):
 
     def __str__(self) -> str:
         return f'{self.recipe} в избранном у {self.user}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя"""
+    subscriber = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='рецепт'
+    )
+    published = models.DateTimeField('опубликован')
+
+    class Meta:
+        default_related_name = 'feed_entries'
+        verbose_name = 'запись ленты подписок'
+        verbose_name_plural = 'записи лент подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subscriber', 'recipe'],
+                name='no duplicated recipe in feed'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['subscriber', '-published', '-recipe'],
+                name='feed_subscriber_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe} в ленте у {self.subscriber}'
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='ингредиент'
+    )
+    amount = models.PositiveIntegerField('количество')
+
+    class Meta:
+        default_related_name = 'shopping_list'
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='no duplicated ingredient in shopping list'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f'{self.ingredient} в количестве {self.amount} '
+            f'в списке покупок у {self.user}'
+        )
@@ -0,0 +1,129 @@
+"""Полнотекстовый поиск рецептов по названию и описанию
+
+В PostgreSQL поиск использует столбец search_vector таблицы рецептов с
+индексом GIN, а в SQLite - таблицу FTS5 recipes_recipe_fts. Столбец и
+таблица создаются миграцией и поддерживаются триггерами базы данных,
+поэтому остаются актуальными и при массовой записи. Название рецепта
+имеет больший вес при ранжировании, чем описание. Для остальных СУБД
+выполняется поиск подстроки без ранжирования.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса названия и описания рецепта в функции bm25 SQLite
+FTS_WEIGHTS = (10.0, 1.0)
+WORD_PATTERN = re.compile(r'\w+')
+
+# Same triggers as created by migration 0021_recipe_search
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+        AFTER INSERT ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    ''',
+    f'{FTS_TABLE}_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+        AFTER DELETE ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+    ''',
+    f'{FTS_TABLE}_update': f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+        AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO {FTS_TABLE} (rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    ''',
+}
+SQLITE_REBUILD = f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+
+
+def restore_sqlite_triggers(using, **kwargs):
+    """
+    Восстановление триггеров FTS5 после миграций. SQLite изменяет
+    таблицу, создавая ее заново, и триггеры старой таблицы удаляются
+    вместе с ней; в этом случае индекс поиска строится заново.
+    """
+    target = connections[using]
+    if target.vendor != 'sqlite':
+        return
+    with target.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+            " AND name LIKE %s", (f'{FTS_TABLE}%',)
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing or existing.issuperset(SQLITE_TRIGGERS):
+            return
+        for statement in SQLITE_TRIGGERS.values():
+            cursor.execute(statement)
+        cursor.execute(SQLITE_REBUILD)
+
+
+def fts_query(text):
+    """Запрос FTS5 из слов текста с поиском по началу каждого слова"""
+    return ' '.join(
+        '"{}"*'.format(word) for word in WORD_PATTERN.findall(text)
+    )
+
+
+def search_recipes(queryset, text):
+    """
+    Отбор рецептов из queryset, содержащих слова text, с сортировкой по
+    убыванию релевантности (аннотация search_rank)
+    """
+    table = Recipe._meta.db_table
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.annotate(
+            search_match=RawSQL(
+                f'{table}.search_vector @@ {tsquery}', (text,),
+                output_field=BooleanField()
+            ),
+            search_rank=RawSQL(
+                f'ts_rank({table}.search_vector, {tsquery})', (text,),
+                output_field=FloatField()
+            )
+        ).filter(search_match=True).order_by('-search_rank', '-id')
+    if connection.vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.none()
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # RawSQL in pk__in is compiled as IN ((SELECT ...)), which SQLite
+        # reads as a single scalar value instead of the subquery rows
+        return queryset.extra(
+            where=[
+                f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[match]
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s '
+                f'AND {FTS_TABLE}.rowid = {table}.id',
+                (match,), output_field=FloatField()
+            )
+        ).order_by('-search_rank', '-id')
+    words = WORD_PATTERN.findall(text)
+    if not words:
+        return queryset.none()
+    condition = Q()
+    for word in words:
+        condition &= Q(name__icontains=word) | Q(text__icontains=word)
+    return queryset.filter(condition).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    ).order_by('-id')
@@ -1,20 +1,386 @@
 """Модуль обработки данных"""
-from django.db.models import F, Sum
+from collections import Counter
 
-from .models import Recipe
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (BigIntegerField, Count, F, OuterRef, Subquery,
+                              Sum, Value, Window)
+from django.db.models.functions import Cast, Coalesce, Greatest, RowNumber
+
+from users.models import Subscription
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem, Tag)
+
+User = get_user_model()
+
+# Попытки изменить списки покупок при одновременном создании позиций
+SHOPPING_LIST_ATTEMPTS = 3
+# Пространство ключей рекомендательных блокировок пользователей
+USER_LOCK_SPACE = 1
 
 
 def get_shopping_list(user):
-    return tuple(
-        Recipe.objects.filter(cart__user=user).values(
-            ingredient_name=F(
-                'recipe_to_ingredients__ingredient__name'
-            ),
-            unit=F(
-                'recipe_to_ingredients__ingredient'
-                '__measurement_unit__notation'
-            )
-        ).annotate(
-            total_amount=Sum('recipe_to_ingredients__amount')
-        ).order_by('-total_amount')
+    """Строки списка покупок пользователя"""
+    return ShoppingListItem.objects.filter(user=user).values(
+        ingredient_name=F('ingredient__name'),
+        unit=F('ingredient__measurement_unit__notation'),
+        total_amount=F('amount')
+    ).order_by('-amount')
+
+
+def get_recipe_amounts(recipe_ids):
+    """Количества ингредиентов рецептов: {id рецепта: {id ингредиента: ...}}"""
+    amounts = {recipe_id: {} for recipe_id in recipe_ids}
+    rows = RecipeIngredient.objects.filter(recipe_id__in=amounts).values_list(
+        'recipe_id', 'ingredient_id', 'amount'
+    )
+    for recipe_id, ingredient_id, amount in rows:
+        amounts[recipe_id][ingredient_id] = amount
+    return amounts
+
+
+def apply_shopping_list_changes(changes):
+    """
+    Применение изменений к спискам покупок.
+
+    changes - словарь приращений количества по ключу (id пользователя,
+    id ингредиента). Позиции с нулевым остатком удаляются. Если ту же
+    позицию одновременно создала другая транзакция, изменения применяются
+    повторно уже к ней.
+    """
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    for attempt in range(SHOPPING_LIST_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                _apply_shopping_list_changes(changes)
+            return
+        except IntegrityError:
+            if attempt == SHOPPING_LIST_ATTEMPTS - 1:
+                raise
+
+
+def _apply_shopping_list_changes(changes):
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user_id__in={user_id for user_id, _ in changes},
+        ingredient_id__in={ingredient_id for _, ingredient_id in changes}
+    )
+    existing = {(item.user_id, item.ingredient_id): item for item in items}
+    created, updated, deleted = [], [], []
+    for (user_id, ingredient_id), delta in changes.items():
+        item = existing.get((user_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                created.append(ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=delta
+                ))
+            continue
+        item.amount += delta
+        if item.amount > 0:
+            updated.append(item)
+        else:
+            deleted.append(item.pk)
+    ShoppingListItem.objects.bulk_create(created)
+    ShoppingListItem.objects.bulk_update(updated, ['amount'])
+    ShoppingListItem.objects.filter(pk__in=deleted).delete()
+
+
+def change_shopping_lists(cart_items, sign=1):
+    """
+    Изменение списков покупок при добавлении (sign=1) или удалении
+    (sign=-1) рецептов. cart_items - пары (id пользователя, id рецепта).
+    """
+    cart_items = list(cart_items)
+    amounts = get_recipe_amounts({recipe_id for _, recipe_id in cart_items})
+    changes = Counter()
+    for user_id, recipe_id in cart_items:
+        for ingredient_id, amount in amounts[recipe_id].items():
+            changes[user_id, ingredient_id] += sign * amount
+    apply_shopping_list_changes(changes)
+
+
+def change_recipe_in_shopping_lists(recipe, old_amounts, new_amounts):
+    """Перенос изменения состава рецепта в списки покупок с этим рецептом"""
+    recipe_changes = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(recipe_changes.values()):
+        return
+    user_ids = ShoppingCart.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True
+    )
+    apply_shopping_list_changes({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in recipe_changes.items()
+    })
+
+
+def insert_from_select(model, fields, rows):
+    """
+    Вставка в таблицу model строк запроса rows одним запросом
+    INSERT ... SELECT. Столбцы rows должны следовать в порядке fields.
+    """
+    select_sql, params = rows.query.sql_with_params()
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(name).column) for name in fields
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(model._meta.db_table)} '
+            f'({columns}) {select_sql}',
+            params
+        )
+
+
+def rebuild_shopping_lists():
+    """
+    Пересоздание списков покупок по корзинам пользователей одним
+    запросом INSERT ... SELECT
+    """
+    ShoppingListItem.objects.all().delete()
+    insert_from_select(
+        ShoppingListItem, ('user', 'ingredient', 'amount'),
+        ShoppingCart.objects
+        .values('user_id', ingredient_id=F(
+            'recipe__recipe_to_ingredients__ingredient'
+        ))
+        .filter(ingredient_id__isnull=False)
+        .annotate(amount=Sum('recipe__recipe_to_ingredients__amount'))
+        .order_by()
+    )
+
+
+LATEST_RECIPES_ORDERING = ('-edited', '-id')
+
+
+def get_latest_recipes(author_ids, limit, fields=None):
+    """
+    Последние limit рецептов каждого из авторов одним запросом.
+
+    Возвращает словарь списков рецептов по id автора. Выборка строится
+    на ROW_NUMBER() с разбиением по автору, а если база данных не
+    поддерживает оконные функции - на коррелированном подзапросе с LIMIT.
+    """
+    latest = {author_id: [] for author_id in author_ids}
+    if not latest or limit <= 0:
+        return latest
+    queryset = Recipe.objects.filter(author_id__in=latest)
+    if fields is not None:
+        queryset = queryset.only('author', *fields)
+    if connection.features.supports_over_clause:
+        ranked = queryset.annotate(position=Window(
+            RowNumber(),
+            partition_by=[F('author')],
+            order_by=[
+                F(field.lstrip('-')).desc() for field
+                in LATEST_RECIPES_ORDERING
+            ]
+        )).order_by()
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE ranked.position <= %s '
+            f'ORDER BY ranked.author_id, ranked.position',
+            (*params, limit)
+        )
+    else:
+        recipes = queryset.filter(pk__in=Subquery(
+            Recipe.objects.filter(author=OuterRef('author'))
+            .order_by(*LATEST_RECIPES_ORDERING).values('pk')[:limit]
+        )).order_by('author', *LATEST_RECIPES_ORDERING)
+    for recipe in recipes:
+        latest[recipe.author_id].append(recipe)
+    return latest
+
+
+def change_counter(queryset, field, delta):
+    """Изменение счетчика в записях queryset на delta"""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_cart_count'
+}
+
+
+def lock_user(user):
+    """
+    Блокировка изменений списков и подписок пользователя до конца
+    транзакции: изменения одного пользователя выполняются по очереди
+    """
+    # A row lock on the user would conflict with the foreign key checks
+    # and counter updates of other users' subscriptions and deadlock
+    # opposite subscriptions, so PostgreSQL takes an advisory lock.
+    # SQLite serializes write transactions itself.
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, %s)', [USER_LOCK_SPACE, user.pk]
+        )
+
+
+def delete_pairs(model, owner_field, owner_id, target_field, target_ids):
+    """
+    Удаление записей model с owner_field = owner_id и target_field из
+    target_ids одним запросом DELETE, без сбора объектов и вызова сигналов
+    """
+    if not target_ids:
+        return 0
+    quote_name = connection.ops.quote_name
+    owner = quote_name(model._meta.get_field(owner_field).column)
+    target = quote_name(model._meta.get_field(target_field).column)
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote_name(model._meta.db_table)} '
+            f'WHERE {owner} = %s AND {target} IN ({placeholders})',
+            [owner_id, *target_ids]
+        )
+        return cursor.rowcount
+
+
+def add_to_recipe_list(model, user, recipe_ids):
+    """
+    Добавление рецептов в избранное или корзину (model) пользователя
+    одним запросом. Сигналы при этом не вызываются, поэтому счетчики и
+    списки покупок изменяются здесь же. Выполняется в транзакции под
+    блокировкой пользователя. Возвращает id добавленных рецептов.
+    """
+    lock_user(user)
+    existing = set(
+        model.objects.filter(user=user, recipe_id__in=recipe_ids)
+        .values_list('recipe_id', flat=True)
+    )
+    added = [pk for pk in recipe_ids if pk not in existing]
+    model.objects.bulk_create(
+        [model(user=user, recipe_id=pk) for pk in added]
+    )
+    change_counter(
+        Recipe.objects.filter(pk__in=added), RECIPE_COUNTERS[model], 1
+    )
+    if model is ShoppingCart:
+        change_shopping_lists([(user.pk, pk) for pk in added])
+    return added
+
+
+def remove_from_recipe_list(model, user, recipe_ids):
+    """
+    Удаление рецептов из избранного или корзины (model) пользователя
+    одним запросом без вызова сигналов. Выполняется в транзакции под
+    блокировкой пользователя. Возвращает id удаленных рецептов.
+    """
+    lock_user(user)
+    removed = list(
+        model.objects.select_for_update()
+        .filter(user=user, recipe_id__in=recipe_ids)
+        .values_list('recipe_id', flat=True)
+    )
+    if model is ShoppingCart:
+        change_shopping_lists([(user.pk, pk) for pk in removed], -1)
+    delete_pairs(model, 'user', user.pk, 'recipe', removed)
+    change_counter(
+        Recipe.objects.filter(pk__in=removed), RECIPE_COUNTERS[model], -1
+    )
+    return removed
+
+
+def _count(model, field):
+    """Подзапрос количества записей model, ссылающихся на запись по field"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field).annotate(count=Count('pk'))
+            .values('count')
+        ),
+        Value(0)
+    )
+
+
+def rebuild_counters():
+    """Пересчет счетчиков рецептов и пользователей по исходным таблицам"""
+    Recipe.objects.update(
+        favorites_count=_count(Favorite, 'recipe'),
+        in_cart_count=_count(ShoppingCart, 'recipe')
+    )
+    User.objects.update(
+        recipes_count=_count(Recipe, 'author'),
+        subscribers_count=_count(Subscription, 'author')
+    )
+
+
+# Старший бит знакового 64-разрядного целого не используется,
+# чтобы маски оставались положительными
+TAG_BITS = 63
+
+
+def tags_mask(bits):
+    """Маска тегов с заданными номерами битов"""
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def get_free_tag_bit(used=None):
+    """Свободный номер бита для нового тега"""
+    if used is None:
+        used = set(
+            Tag.objects.filter(bit__isnull=False)
+            .values_list('bit', flat=True)
+        )
+    for bit in range(TAG_BITS):
+        if bit not in used:
+            return bit
+    raise ValueError(f'Количество тегов не может превышать {TAG_BITS}')
+
+
+def assign_tag_bits():
+    """Назначение битов тегам, созданным без сигналов"""
+    used = set(
+        Tag.objects.filter(bit__isnull=False).values_list('bit', flat=True)
+    )
+    for tag in Tag.objects.filter(bit__isnull=True).order_by('pk'):
+        tag.bit = get_free_tag_bit(used)
+        used.add(tag.bit)
+        tag.save(update_fields=['bit'])
+
+
+def _tags_mask():
+    """Подзапрос маски тегов рецепта"""
+    return Coalesce(
+        Subquery(
+            Recipe.tags.through.objects
+            .filter(recipe=OuterRef('pk'), tag__bit__isnull=False)
+            .order_by().values('recipe')
+            .annotate(mask=Sum(
+                Cast(Value(1), BigIntegerField()).bitleftshift(
+                    F('tag__bit')
+                ),
+                output_field=BigIntegerField()
+            ))
+            .values('mask')
+        ),
+        Value(0)
+    )
+
+
+def update_tags_masks(recipes):
+    """Пересчет масок тегов рецептов из queryset по их тегам"""
+    return recipes.update(tags_mask=_tags_mask())
+
+
+def clear_tag_bit(bit):
+    """Снятие бита удаленного тега в масках рецептов"""
+    mask = 1 << bit
+    Recipe.objects.filter(tags_mask__hasanybits=mask).update(
+        tags_mask=F('tags_mask').bitand(~mask)
     )
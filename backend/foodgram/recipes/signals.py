@@ -0,0 +1,158 @@
+"""Обработчики сигналов моделей рецептов"""
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .feed import fan_out_recipe, remove_recipe
+from .images import schedule_recipe_image, schedule_variants_removal
+from .models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag, Unit,
+                     User)
+from .services import (RECIPE_COUNTERS, change_counter, change_shopping_lists,
+                       clear_tag_bit, get_free_tag_bit, update_tags_masks)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_list_item_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            RECIPE_COUNTERS[sender], 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_list_item_deleted(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id),
+        RECIPE_COUNTERS[sender], -1
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_shopping_lists([(instance.user_id, instance.recipe_id)])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_item_deleting(sender, instance, **kwargs):
+    """Вычитание рецепта из списка покупок, пока его состав еще доступен"""
+    change_shopping_lists([(instance.user_id, instance.recipe_id)], -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, raw, update_fields, **kwargs):
+    """
+    Запоминание прежних автора и изображения рецепта перед сохранением.
+    Новое загруженное изображение еще не записано в хранилище и может
+    называться так же, как прежнее, поэтому замена определяется и по
+    признаку _committed файла.
+    """
+    instance._previous_author_id = instance.author_id
+    instance._previous_image = None
+    instance._image_changed = False
+    if raw:
+        return
+    if instance._state.adding:
+        instance._previous_author_id = None
+        instance._image_changed = bool(instance.image)
+    else:
+        fields = {'author', 'image'}
+        if update_fields is not None:
+            fields &= set(update_fields)
+        previous = fields and (
+            Recipe.objects.filter(pk=instance.pk)
+            .values('author_id', 'image').first()
+        )
+        if previous:
+            if 'author' in fields:
+                instance._previous_author_id = previous['author_id']
+            if 'image' in fields:
+                instance._image_changed = (
+                    not instance.image._committed
+                    or previous['image'] != instance.image.name
+                )
+                if instance._image_changed and previous['image']:
+                    instance._previous_image = previous['image']
+    if instance._image_changed:
+        instance.images_ready = False
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if instance._image_changed:
+        if not created:
+            # images_ready is left out of full saves (background_fields)
+            Recipe.objects.filter(pk=instance.pk).update(images_ready=False)
+        schedule_recipe_image(instance)
+    if instance._previous_image:
+        schedule_variants_removal(instance._previous_image)
+    previous_author_id = instance._previous_author_id
+    if previous_author_id == instance.author_id:
+        return
+    if previous_author_id is not None:
+        change_counter(
+            User.objects.filter(pk=previous_author_id), 'recipes_count', -1
+        )
+        remove_recipe(instance)
+    if instance.author_id is not None:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+        fan_out_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    if instance.image:
+        schedule_variants_removal(instance.image.name)
+    if instance.author_id is not None:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Unit)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Unit)
+@receiver(post_delete, sender=Tag)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Tag)
+def tag_saving(sender, instance, raw, **kwargs):
+    """Назначение новому тегу свободного бита маски"""
+    if instance.bit is None and not raw:
+        instance.bit = get_free_tag_bit()
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    if instance.bit is not None:
+        clear_tag_bit(instance.bit)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пересчет масок тегов рецептов после изменения их тегов"""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list('pk', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance._cleared_recipe_ids
+    else:
+        recipe_ids = pk_set
+    update_tags_masks(Recipe.objects.filter(pk__in=recipe_ids))
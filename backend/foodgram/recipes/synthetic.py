@@ -0,0 +1,241 @@
+"""Генерация синтетических данных для нагрузочного тестирования
+
+Пользователи, рецепты с ингредиентами и тегами, избранное, корзины и
+подписки создаются пакетами через bulk_create. Генератор случайных
+чисел инициализируется заданным значением, поэтому одинаковые параметры
+дают одинаковый набор данных. Популярность авторов и рецептов подчиняется
+распределению Ципфа с показателем skew (0 - равномерное распределение):
+популярные авторы чаще публикуют рецепты и чаще получают подписчиков,
+популярные рецепты чаще попадают в избранное и корзины. Сигналы при
+массовой вставке не вызываются, поэтому в конце пересчитываются счетчики,
+списки покупок и ленты подписок.
+"""
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+
+from users.models import Subscription
+from .feed import rebuild_feeds
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Tag, Unit, User)
+from .services import (assign_tag_bits, rebuild_counters,
+                       rebuild_shopping_lists, update_tags_masks)
+
+BATCH_SIZE = 5000
+PASSWORD = 'synthetic-password'
+INGREDIENTS_PER_RECIPE = (3, 10)
+TAGS_PER_RECIPE = (1, 3)
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F4A261', '#2A9D8F')
+DEFAULT_INGREDIENTS = 2000
+DEFAULT_TAGS = 5
+DEFAULT_SKEW = 1.0
+SAMPLE_ATTEMPTS = 5
+
+
+def bulk_create(model, objects, batch_size=BATCH_SIZE):
+    """Вставка объектов из итератора пакетами по batch_size"""
+    objects = iter(objects)
+    created = 0
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return created
+        model.objects.bulk_create(batch)
+        created += len(batch)
+
+
+def _new_pks(model, last_pk):
+    return list(
+        model.objects.filter(pk__gt=last_pk or 0)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def _last_pk(model):
+    return model.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса рангов 1..count в распределении Ципфа"""
+    weights = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += rank ** -skew
+        weights.append(total)
+    return weights
+
+
+def _split(total, parts):
+    """Распределение total по parts частям с разницей не больше единицы"""
+    share, remainder = divmod(total, parts)
+    return [share + (index < remainder) for index in range(parts)]
+
+
+class DataGenerator:
+    """Генератор связанных наборов записей"""
+
+    def __init__(self, seed=0, skew=DEFAULT_SKEW, batch_size=BATCH_SIZE):
+        self.random = random.Random(seed)
+        self.skew = skew
+        self.batch_size = batch_size
+
+    def bulk_create(self, model, objects):
+        return bulk_create(model, objects, self.batch_size)
+
+    def popularity(self, pks):
+        """
+        Ключи в случайном порядке рангов и накопленные веса для выбора,
+        None при равномерном распределении
+        """
+        if not self.skew:
+            return pks, None
+        pks = list(pks)
+        self.random.shuffle(pks)
+        return pks, zipf_weights(len(pks), self.skew)
+
+    def sample(self, pks, weights, count):
+        """Выборка count различных ключей с учетом весов"""
+        if weights is None:
+            return self.random.sample(pks, count)
+        chosen = {}
+        for _ in range(SAMPLE_ATTEMPTS):
+            for pk in self.random.choices(
+                pks, cum_weights=weights, k=count - len(chosen)
+            ):
+                chosen.setdefault(pk)
+            if len(chosen) == count:
+                return list(chosen)
+        for pk in self.random.sample(pks, min(count + len(chosen), len(pks))):
+            chosen.setdefault(pk)
+        return list(chosen)[:count]
+
+    def users(self, count):
+        last_pk = _last_pk(User)
+        password = make_password(PASSWORD)
+        self.bulk_create(User, (
+            User(
+                username=f'user{index}', email=f'user{index}@example.org',
+                first_name='Имя', last_name=f'Фамилия {index}',
+                password=password
+            )
+            for index in range(last_pk + 1, last_pk + count + 1)
+        ))
+        return _new_pks(User, last_pk)
+
+    def ingredients(self, count=DEFAULT_INGREDIENTS):
+        """Существующие ингредиенты или count новых при пустом справочнике"""
+        pks = list(Ingredient.objects.values_list('pk', flat=True))
+        if pks:
+            return pks
+        unit = Unit.objects.create(notation='г')
+        self.bulk_create(Ingredient, (
+            Ingredient(name=f'Ингредиент {index}', measurement_unit=unit)
+            for index in range(1, count + 1)
+        ))
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def tags(self, count=DEFAULT_TAGS):
+        """Существующие теги или count новых при пустом справочнике"""
+        pks = list(Tag.objects.values_list('pk', flat=True))
+        if pks:
+            return pks
+        self.bulk_create(Tag, (
+            Tag(
+                name=f'Тег {index}', slug=f'tag{index}',
+                color=TAG_COLORS[index % len(TAG_COLORS)]
+            )
+            for index in range(1, count + 1)
+        ))
+        assign_tag_bits()
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def recipes(self, count, authors, ingredient_pks, tag_pks):
+        last_pk = _last_pk(Recipe)
+        author_pks, weights = authors
+        self.bulk_create(Recipe, (
+            Recipe(
+                name=f'Рецепт {index}', text=f'Описание рецепта {index}',
+                image=f'synthetic/recipe{index % 100}.jpg',
+                cooking_time=self.random.randint(1, 180),
+                author_id=author_pk
+            )
+            for index, author_pk in zip(
+                range(last_pk + 1, last_pk + count + 1),
+                self.random.choices(author_pks, cum_weights=weights, k=count)
+            )
+        ))
+        recipe_pks = _new_pks(Recipe, last_pk)
+        self.bulk_create(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_pk, ingredient_id=ingredient_pk,
+                amount=self.random.randint(1, 500)
+            )
+            for recipe_pk in recipe_pks
+            for ingredient_pk in self.random.sample(
+                ingredient_pks,
+                min(self.random.randint(*INGREDIENTS_PER_RECIPE),
+                    len(ingredient_pks))
+            )
+        ))
+        self.bulk_create(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_pk, tag_id=tag_pk)
+            for recipe_pk in recipe_pks
+            for tag_pk in self.random.sample(
+                tag_pks,
+                min(self.random.randint(*TAGS_PER_RECIPE), len(tag_pks))
+            )
+        ))
+        update_tags_masks(Recipe.objects.filter(pk__gt=last_pk))
+        return recipe_pks
+
+    def pairs(self, total, left_pks, right, exclude_same=False):
+        """
+        Уникальные пары (левый, правый) общим числом до total,
+        распределенные поровну между левыми ключами. Правые ключи
+        выбираются с учетом популярности right.
+        """
+        right_pks, weights = right
+        for left_pk, count in zip(left_pks, _split(total, len(left_pks))):
+            count = min(count, len(right_pks) - exclude_same)
+            sample = self.sample(
+                right_pks, weights,
+                min(count + exclude_same, len(right_pks))
+            )
+            yield from islice((
+                (left_pk, right_pk) for right_pk in sample
+                if not (exclude_same and right_pk == left_pk)
+            ), count)
+
+    def user_lists(self, model, total, user_pks, recipes):
+        return self.bulk_create(model, (
+            model(user_id=user_pk, recipe_id=recipe_pk)
+            for user_pk, recipe_pk in self.pairs(total, user_pks, recipes)
+        ))
+
+    def subscriptions(self, total, user_pks, authors):
+        return self.bulk_create(Subscription, (
+            Subscription(subscriber_id=subscriber_pk, author_id=author_pk)
+            for subscriber_pk, author_pk in self.pairs(
+                total, user_pks, authors, exclude_same=True
+            )
+        ))
+
+    @transaction.atomic
+    def generate(self, users, recipes, favorites, cart, subscriptions):
+        """Создание полного набора данных и пересчет производных таблиц"""
+        user_pks = self.users(users)
+        authors = self.popularity(user_pks)
+        recipe_pks = self.recipes(
+            recipes, authors, self.ingredients(), self.tags()
+        )
+        popular_recipes = self.popularity(recipe_pks)
+        self.user_lists(Favorite, favorites, user_pks, popular_recipes)
+        self.user_lists(ShoppingCart, cart, user_pks, popular_recipes)
+        self.subscriptions(subscriptions, user_pks, authors)
+        rebuild_counters()
+        rebuild_shopping_lists()
+        rebuild_feeds()
+        return user_pks, recipe_pks
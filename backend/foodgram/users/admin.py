@@ -38,8 +38,12 @@ class SubscriptionAdmin(admin.ModelAdmin):
 
 @admin.register(WebUser)
 class WebUserAdmin(admin.ModelAdmin):
-    list_display = ('first_name', 'last_name', 'username', 'email', 'is_staff')
+    list_display = (
+        'first_name', 'last_name', 'username', 'email', 'is_staff',
+        'recipes_count', 'subscribers_count'
+    )
     list_display_links = ('username',)
+    readonly_fields = ('recipes_count', 'subscribers_count')
     search_fields = ('email', 'username')
     inlines = (FavoritesInline, ShoppingCartInline, SubscriptionsInline)
     fieldsets = (
@@ -54,4 +58,5 @@ class WebUserAdmin(admin.ModelAdmin):
             ),
         }),
         (_('Important dates'), {'fields': ('last_login', 'date_joined')}),
+        ('Активность', {'fields': ('recipes_count', 'subscribers_count')}),
     )
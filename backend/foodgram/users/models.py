@@ -4,7 +4,36 @@ from django.db import models
 from .validators import username_validator
 
 
-class WebUser(AbstractUser):
+class CountersMixin:
+    """
+    Модель с денормализованными счетчиками counter_fields, которые
+    изменяются только запросами UPDATE с F-выражениями, и полями
+    background_fields, которые так же записывают фоновые задачи.
+    Сохранение существующей записи не записывает эти поля, иначе устаревшие
+    значения экземпляра затерли бы изменения, сделанные после его загрузки.
+    """
+    counter_fields = ()
+    background_fields = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            skipped = set(self.counter_fields).union(self.background_fields)
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                    and field.name not in skipped
+                ]
+            else:
+                update_fields = [
+                    name for name in update_fields if name not in skipped
+                ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class WebUser(CountersMixin, AbstractUser):
     username = models.CharField(
         'имя пользователя',
         max_length=150,
@@ -22,6 +51,14 @@ class WebUser(AbstractUser):
         max_length=150,
         null=True, blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        'рецептов', default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'подписчиков', default=0, editable=False
+    )
+
+    counter_fields = ('recipes_count', 'subscribers_count')
 
 
 class Subscription(models.Model):
@@ -51,6 +88,14 @@ class Subscription(models.Model):
                 name='no_self_subscriptions'
             )
         ]
+        indexes = [
+            # Subscriptions of a user in the order of the subscriptions page;
+            # author_id makes the index covering for the join with users
+            models.Index(
+                fields=['subscriber', '-id', 'author'],
+                name='subscription_subscriber_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return f'{self.subscriber} подписан на {self.author}'
@@ -0,0 +1,48 @@
+"""Модуль обработки данных пользователей"""
+from recipes.feed import subscriptions_added, subscriptions_removed
+from recipes.services import change_counter, delete_pairs, lock_user
+from .models import Subscription, WebUser
+
+
+def add_subscriptions(subscriber, author_ids):
+    """
+    Подписка на авторов одним запросом. Сигналы при этом не вызываются,
+    поэтому счетчики подписчиков и лента изменяются здесь же. Возвращает
+    id авторов, подписка на которых добавлена. Выполняется в транзакции
+    под блокировкой подписчика.
+    """
+    lock_user(subscriber)
+    existing = set(
+        Subscription.objects.filter(
+            subscriber=subscriber, author_id__in=author_ids
+        ).values_list('author_id', flat=True)
+    )
+    added = [pk for pk in author_ids if pk not in existing]
+    Subscription.objects.bulk_create(
+        [Subscription(subscriber=subscriber, author_id=pk) for pk in added]
+    )
+    change_counter(
+        WebUser.objects.filter(pk__in=added), 'subscribers_count', 1
+    )
+    subscriptions_added(subscriber.pk, added)
+    return added
+
+
+def remove_subscriptions(subscriber, author_ids):
+    """
+    Отписка от авторов одним запросом без вызова сигналов. Выполняется
+    в транзакции под блокировкой подписчика. Возвращает id авторов,
+    подписка на которых удалена.
+    """
+    lock_user(subscriber)
+    removed = list(
+        Subscription.objects.select_for_update().filter(
+            subscriber=subscriber, author_id__in=author_ids
+        ).values_list('author_id', flat=True)
+    )
+    delete_pairs(Subscription, 'subscriber', subscriber.pk, 'author', removed)
+    change_counter(
+        WebUser.objects.filter(pk__in=removed), 'subscribers_count', -1
+    )
+    subscriptions_removed(subscriber.pk, removed)
+    return removed
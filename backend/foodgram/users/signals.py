@@ -0,0 +1,26 @@
+"""Обработчики сигналов моделей пользователей"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.feed import subscriptions_added, subscriptions_removed
+from recipes.services import change_counter
+from .models import Subscription, WebUser
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_counter(
+            WebUser.objects.filter(pk=instance.author_id),
+            'subscribers_count', 1
+        )
+        subscriptions_added(instance.subscriber_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    change_counter(
+        WebUser.objects.filter(pk=instance.author_id),
+        'subscribers_count', -1
+    )
+    subscriptions_removed(instance.subscriber_id, [instance.author_id])